@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+# Benchmark for the log parsers in this directory.  It writes a synthetic
+# corpus with synthetic_logs.py (or uses an existing one) and times
+# log_analyzer.py, log_threadpool_analyzer.py and strace_parser.py over
+# it, serially and in parallel, reporting input lines and megabytes per
+# second and the peak RSS of the run.
+#
+# Each run is a set of child processes with their output discarded.  Peak
+# RSS is the largest ru_maxrss os.wait4() reports for them, which on Linux
+# covers the worker processes they wait for in turn.  Parallel runs of the
+# scripts that read a single log start one process per osd, --jobs at a
+# time; log_threadpool_analyzer.py is also run with its own --jobs.
+#
+# Usage:
+#
+# bench_analysis.py [--corpus DIR] [--jobs N] [--repeat N]
+#                   [--tools TOOL,...] [--osds N] [--rate OPS]
+#                   [--seconds SECONDS] [--size MB]
+
+import argparse
+import glob
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic_logs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TOOLS = ['log_analyzer', 'log_threadpool_analyzer', 'strace_parser']
+
+def log_analyzer_runs(corpus, jobs):
+    # (mode, [argv, ...], parallel processes, inputs) for each run.
+    script = os.path.join(HERE, 'log_analyzer.py')
+    inputs = sorted(glob.glob(os.path.join(corpus, 'osd.*.log')))
+    return [
+        ('serial', [[script, corpus]], 1, inputs),
+        ('stream', [[script, '--stream', corpus]], 1, inputs),
+        ('jobs=%d' % jobs, [[script, '--jobs', str(jobs), corpus]], 1,
+         inputs),
+        ]
+
+def per_log_runs(script, pattern):
+    def runs(corpus, jobs):
+        inputs = sorted(glob.glob(os.path.join(corpus, pattern)))
+        argvs = [[os.path.join(HERE, script), fn] for fn in inputs]
+        return [
+            ('serial', argvs, 1, inputs),
+            ('procs=%d' % jobs, argvs, jobs, inputs),
+            ]
+    return runs
+
+def threadpool_runs(corpus, jobs):
+    # Per-log runs, and each log split between jobs processes in turn.
+    script = os.path.join(HERE, 'log_threadpool_analyzer.py')
+    inputs = sorted(glob.glob(os.path.join(corpus, 'osd.*.log')))
+    argvs = [[script, '--jobs', str(jobs), fn] for fn in inputs]
+    return per_log_runs('log_threadpool_analyzer.py', 'osd.*.log')(
+        corpus, jobs) + [('jobs=%d' % jobs, argvs, 1, inputs)]
+
+RUNS = {
+    'log_analyzer': log_analyzer_runs,
+    'log_threadpool_analyzer': threadpool_runs,
+    'strace_parser': per_log_runs('strace_parser.py', 'osd.*.strace'),
+    }
+
+def count_lines(filenames, _counted={}):
+    # (lines, bytes) of the inputs, each file counted once.
+    lines = size = 0
+    for fn in filenames:
+        if fn not in _counted:
+            n = 0
+            with open(fn, 'rb') as f:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    n += block.count('\n')
+            _counted[fn] = (n, os.path.getsize(fn))
+        lines += _counted[fn][0]
+        size += _counted[fn][1]
+    return (lines, size)
+
+def run(argvs, parallel):
+    # Run the commands, parallel at a time; returns (seconds, peak RSS in
+    # kilobytes).
+    devnull = open(os.devnull, 'wb')
+    todo = list(argvs)
+    running = {}
+    peak = 0
+    failed = []
+    start = time.time()
+    try:
+        while todo or running:
+            while todo and len(running) < parallel:
+                argv = todo.pop(0)
+                proc = subprocess.Popen([sys.executable] + argv,
+                                        stdout=devnull)
+                running[proc.pid] = (proc, argv)
+            pid, status, usage = os.wait4(-1, 0)
+            if pid not in running:
+                continue
+            proc, argv = running.pop(pid)
+            proc.returncode = status
+            peak = max(peak, usage.ru_maxrss)
+            if status != 0:
+                failed.append(' '.join(argv))
+    finally:
+        devnull.close()
+    elapsed = time.time() - start
+    if failed:
+        raise RuntimeError('failed: %s' % '; '.join(failed))
+    return (elapsed, peak)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the log parsers on a synthetic corpus.')
+    parser.add_argument(
+        '--corpus',
+        metavar='DIR',
+        help='Use the logs in DIR, as written by synthetic_logs.py, instead '
+             'of writing a new corpus to a temporary directory.',
+        )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=4,
+        help='Processes for the parallel runs (default 4).',
+        )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Run each case this many times and report the fastest '
+             '(default 1).',
+        )
+    parser.add_argument(
+        '--tools',
+        default=','.join(TOOLS),
+        metavar='TOOL,...',
+        help='Tools to benchmark (default %s).' % ','.join(TOOLS),
+        )
+    parser.add_argument(
+        '--osds',
+        type=int,
+        default=4,
+        help='Osds in a new corpus (default 4).',
+        )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=1000.0,
+        metavar='OPS',
+        help='Client writes per second in a new corpus (default 1000).',
+        )
+    parser.add_argument(
+        '--seconds',
+        type=float,
+        default=10.0,
+        help='Seconds of log time in a new corpus (default 10).',
+        )
+    parser.add_argument(
+        '--size',
+        type=float,
+        metavar='MB',
+        help='Size of a new corpus\' osd logs, instead of --seconds.',
+        )
+    ctx = parser.parse_args()
+    ctx.tools = ctx.tools.split(',')
+    for tool in ctx.tools:
+        if tool not in RUNS:
+            parser.error('unknown tool %s' % tool)
+    return ctx
+
+def main():
+    ctx = parse_args()
+    corpus = ctx.corpus
+    if corpus is None:
+        corpus = tempfile.mkdtemp(prefix='bench_analysis.')
+        argv = ['--osds', str(ctx.osds), '--rate', str(ctx.rate),
+                '--seconds', str(ctx.seconds), corpus]
+        if ctx.size:
+            argv[:0] = ['--size', str(ctx.size)]
+        start = time.time()
+        ops = synthetic_logs.Cluster(synthetic_logs.parse_args(argv)).run()
+        print "wrote %d ops to %s in %.1f s" % (ops, corpus,
+                                                time.time() - start)
+        print ""
+    try:
+        print "%-24s %-9s %9s %11s %8s %12s" % (
+            "tool", "mode", "seconds", "lines/s", "MB/s", "peak RSS MB")
+        for tool in ctx.tools:
+            for mode, argvs, parallel, inputs in RUNS[tool](corpus,
+                                                            ctx.jobs):
+                lines, size = count_lines(inputs)
+                elapsed, peak = min(run(argvs, parallel)
+                                    for _ in xrange(ctx.repeat))
+                print "%-24s %-9s %9.2f %11.0f %8.2f %12.1f" % (
+                    tool, mode, elapsed, lines / elapsed,
+                    size / elapsed / (1 << 20), peak / 1024.0)
+                sys.stdout.flush()
+    finally:
+        if ctx.corpus is None:
+            shutil.rmtree(corpus)
+
+if __name__ == '__main__':
+    main()
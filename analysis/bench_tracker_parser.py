@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+# Micro-benchmark for log_analyzer.py's op tracker line parser.  It times
+# parse_tracker_line() against the regex and strptime parser it replaced on
+# a synthetic osd log held in memory, and checks that both agree on the
+# reqid, time and event, the fields parse_tracker_line() returns.
+#
+# Usage:
+#
+# bench_tracker_parser.py [--lines N] [--tracker-ratio R]
+
+import argparse
+import random
+import re
+import time
+from datetime import datetime,timedelta
+
+import log_analyzer
+import logio
+
+tracker_regex = re.compile('.*reqid: (.+), seq: ([0-9]+), time: (\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d\.\d\d\d\d\d\d), event: (.*), request: (.*)')
+
+EVENTS = ['header_read', 'throttled', 'all_read', 'dispatched', 'reached_pg',
+          'started', 'waiting for subops from [1,2]', 'op_commit',
+          'op_applied', 'sub_op_commit_rec', 'commit_sent', 'done']
+
+def parse_tracker_line_regex(line):
+    retval = {}
+    match = tracker_regex.match(line)
+    if match:
+        retval['reqid'] = match.group(1)
+        retval['seq'] = int(match.group(2))
+        retval['time'] = datetime.strptime(
+            match.group(3), '%Y-%m-%d %H:%M:%S.%f'
+            )
+        retval['event'] = match.group(4)
+        retval['request'] = match.group(5)
+        return retval
+    return None
+
+def synthetic_log(lines, ratio):
+    rand = random.Random(0)
+    now = datetime(2014, 5, 1, 10, 0, 0)
+    out = []
+    for n in xrange(lines):
+        now += timedelta(microseconds=rand.randint(1, 500))
+        stamp = now.strftime('%Y-%m-%d %H:%M:%S.%f')
+        if rand.random() < ratio:
+            tid = n / len(EVENTS) + 1
+            out.append('%s 7f0a1b2c3700  5 -- op tracker -- reqid: '
+                       'client.4123.0:%d, seq: %d, time: %s, event: %s, '
+                       'request: osd_op(client.4123.0:%d rb.0.1.%08x '
+                       '[write 0~4096] 3.5a ondisk+write e12) v4\n' % (
+                       stamp, tid, n, stamp, rand.choice(EVENTS), tid, tid))
+        else:
+            out.append('%s 7f0a1b2c3700 10 osd.0 pg_epoch: 12 pg[3.5a( v '
+                       '12\'%d (0\'0,12\'%d] local-les=5 n=%d ec=1 les/c 5/5 '
+                       '4/4/4) [0,1,2] r=0 lpr=4 crt=0\'0 mlcod 0\'0 '
+                       'active+clean] do_op\n' % (stamp, n, n, n))
+    return out
+
+def bench(name, func, lines):
+    start = time.time()
+    parsed = [func(line) for line in lines]
+    elapsed = time.time() - start
+    print "%-8s %10.3f s %12.0f lines/s" % (
+        name, elapsed, len(lines) / elapsed)
+    return elapsed, parsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the op tracker line parser.')
+    parser.add_argument(
+        '--lines',
+        type=int,
+        default=500000,
+        help='Number of synthetic log lines (default 500000).',
+        )
+    parser.add_argument(
+        '--tracker-ratio',
+        type=float,
+        default=0.5,
+        help='Fraction of lines that are op tracker lines (default 0.5).',
+        )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    ctx = parse_args()
+    lines = synthetic_log(ctx.lines, ctx.tracker_ratio)
+    regex_time, expected = bench('regex', parse_tracker_line_regex, lines)
+    fast_time, got = bench('fast', log_analyzer.parse_tracker_line, lines)
+    for old, new in zip(expected, got):
+        if old is not None:
+            old['time'] = logio.log_time(
+                old['time'].strftime('%Y-%m-%d %H:%M:%S.%f'))
+            del old['seq'], old['request']
+        if old != new:
+            print "MISMATCH: %s != %s" % (old, new)
+            break
+    print "speedup  %10.2fx" % (regex_time / fast_time)
@@ -0,0 +1,232 @@
+#!/usr/bin/python
+
+# Checks that the parsers that split logs between worker processes give the
+# same results as one serial pass.  Logs are cut into byte ranges far
+# smaller than a real run would use (logio.MIN_RANGE is lowered to 1 and
+# logio.WINDOW to one page), so a few megabytes of log take many ranges and
+# windows, and every result is compared with the serial one for each
+# --jobs count.
+#
+# log_analyzer.py: the requests a Tracker finishes from the per-range
+# partials of parallel_tracker_events(), with their events, primary and
+# replicas, against those of serial_tracker_events().
+#
+# log_threadpool_analyzer.py: the whole report of sweep() with each --jobs
+# count against that of one sweep, for every osd log of the corpus and for
+# --random logs of threadpool, journal and filestore queue lines in random
+# order.  Those have lines logged up to 5 seconds late, dones without a
+# start, repeated dones and ops left in flight, which is what the carrying
+# over of work, waits and queued ops between ranges has to get right.
+#
+# The logs are a synthetic_logs.py corpus, written to a temporary directory
+# unless --corpus is given.  The exit status is 1 if any result differs.
+#
+# Usage:
+#
+# check_parallel.py [--corpus DIR] [--jobs N,N,...] [--random N] [--seed N]
+
+import argparse
+import glob
+import mmap
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+
+import log_analyzer
+import log_threadpool_analyzer
+import logio
+import synthetic_logs
+
+# Threads of the pools in random logs.
+RANDOM_POOLS = {
+    'FileStore::op_tp': ['7f01', '7f02', '7f03'],
+    'OSD::op_tp': ['7e01', '7e02'],
+    }
+
+RANDOM_WQS = ['OpWQ', 'CommitWQ']
+
+# Lines per random log.
+RANDOM_LINES = 3000
+
+def tracker_requests(osd_logs, jobs):
+    # {reqid: (named events, primary, replicas)} of the finished requests.
+    done = {}
+    def sink(req):
+        done[req.reqid] = (req.named_events(), req.primary(),
+                           req.replicas())
+    tracker = log_analyzer.Tracker(sink)
+    if jobs == 1:
+        for parsed in log_analyzer.serial_tracker_events(osd_logs):
+            tracker.add_event(parsed)
+    else:
+        for osd, names, partial in log_analyzer.parallel_tracker_events(
+                osd_logs, jobs):
+            tracker.add_partial(osd, names, partial)
+    tracker.flush()
+    return done
+
+def check_log_analyzer(corpus, jobs):
+    # Returns the number of job counts whose requests differ.
+    osd_logs = log_analyzer.get_logs(corpus)['osd']
+    serial = tracker_requests(osd_logs, 1)
+    failed = 0
+    for n in jobs:
+        ranges = len(log_analyzer.osd_log_jobs(osd_logs, n))
+        parallel = tracker_requests(osd_logs, n)
+        differ = [reqid for reqid in set(serial) | set(parallel)
+                  if serial.get(reqid) != parallel.get(reqid)]
+        if differ:
+            failed += 1
+        print "log_analyzer jobs=%d ranges=%d requests=%d: %s" % (
+            n, ranges, len(serial),
+            "%d requests differ, e.g. %s" % (len(differ), min(differ))
+            if differ else "ok")
+    return failed
+
+def random_threadpool_log(filename, seed):
+    # A log of RANDOM_LINES lines, 2% of them logged late.  Filestore seqs
+    # are never reused, as within one osd run.
+    rand = random.Random(seed)
+    stamp = synthetic_logs.Stamps()
+    now = logio.log_time(synthetic_logs.START)
+    items = ['0x%x' % i for i in xrange(6)]
+    queued = []
+    running = []
+    seq = 0
+    with open(filename, 'wb') as f:
+        for n in xrange(RANDOM_LINES):
+            now += rand.randint(0, 40000)
+            when = now
+            if rand.random() < 0.02:
+                when -= rand.randint(0, 5000000)
+            pick = rand.random()
+            if pick < 0.3:
+                if not queued or rand.random() < 0.4:
+                    seq += 1
+                    queued.append(seq)
+                    text = 'queue_op 0x1 seq %d osr(1.0 0x1) 4096 bytes' % \
+                        seq
+                elif not running or rand.random() < 0.5:
+                    running.append(queued.pop(0))
+                    text = '_do_op 0x1 seq %d osr(1.0 0x1)/0x1 start' % \
+                        running[-1]
+                else:
+                    text = '_finish_op 0x1 seq %d osr(1.0 0x1)/0x1 lat 0.1' \
+                        % running.pop(rand.randrange(len(running)))
+                if rand.random() < 0.05:
+                    # Lost, as when the log level changes.
+                    continue
+                line = '7f01  5 filestore(/x) %s' % text
+            elif pick < 0.35:
+                line = '7f99 10 filestore(/x) other line %d' % n
+            elif pick < 0.45:
+                line = '7d00 20 journal write_thread_entry %s' % rand.choice(
+                    ['woke up', 'going to sleep', 'other'])
+            else:
+                pool = rand.choice(sorted(RANDOM_POOLS))
+                prefix = '%s 20 %s worker' % (
+                    rand.choice(RANDOM_POOLS[pool]), pool)
+                pick = rand.random()
+                if pick < 0.25:
+                    line = prefix + ' waiting'
+                elif pick < 0.3:
+                    line = prefix + ' wq'
+                elif pick < 0.35:
+                    line = prefix + ' other'
+                else:
+                    line = '%s wq %s::%s %s processing %s (1 active)' % (
+                        prefix, pool.split('::')[0], rand.choice(RANDOM_WQS),
+                        rand.choice(['start', 'done', 'done']),
+                        rand.choice(items))
+            f.write('%s %s\n' % (stamp(when), line))
+
+def threadpool_report(filename, jobs):
+    out = StringIO()
+    stdout, sys.stdout = sys.stdout, out
+    try:
+        log_threadpool_analyzer.output(
+            *log_threadpool_analyzer.sweep(filename, jobs))
+    finally:
+        sys.stdout = stdout
+    return out.getvalue()
+
+def check_threadpool(filenames, jobs):
+    # Returns the number of (log, job count) reports that differ.
+    failed = 0
+    for filename in filenames:
+        serial = threadpool_report(filename, 1)
+        for n in jobs:
+            ranges = len(logio.line_ranges(filename, n))
+            differ = threadpool_report(filename, n) != serial
+            if differ:
+                failed += 1
+            print "log_threadpool_analyzer %s jobs=%d ranges=%d: %s" % (
+                os.path.basename(filename), n, ranges,
+                "report differs" if differ else "ok")
+    return failed
+
+def job_counts(value):
+    try:
+        return [int(n) for n in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a list of counts' % value)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Check parallel log parsing against a serial pass.')
+    parser.add_argument(
+        '--corpus',
+        metavar='DIR',
+        help='Use the logs in DIR, as written by synthetic_logs.py, instead '
+             'of writing a new corpus to a temporary directory.',
+        )
+    parser.add_argument(
+        '--jobs',
+        type=job_counts,
+        default=[2, 7, 33],
+        metavar='N,N,...',
+        help='Worker process counts to check (default 2,7,33).',
+        )
+    parser.add_argument(
+        '--random',
+        type=int,
+        default=8,
+        metavar='N',
+        help='Random threadpool logs to check (default 8).',
+        )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Random seed of a new corpus and the random logs (default 0).',
+        )
+    return parser.parse_args()
+
+def main():
+    ctx = parse_args()
+    logio.MIN_RANGE = 1
+    logio.WINDOW = mmap.ALLOCATIONGRANULARITY
+    scratch = tempfile.mkdtemp(prefix='check_parallel.')
+    corpus = ctx.corpus
+    try:
+        if corpus is None:
+            corpus = os.path.join(scratch, 'corpus')
+            os.mkdir(corpus)
+            synthetic_logs.Cluster(synthetic_logs.parse_args(
+                ['--osds', '3', '--rate', '300', '--seconds', '3',
+                 '--seed', str(ctx.seed), corpus])).run()
+        failed = check_log_analyzer(corpus, ctx.jobs)
+        logs = sorted(glob.glob(os.path.join(corpus, 'osd.*.log')))
+        for n in xrange(ctx.random):
+            logs.append(os.path.join(scratch, 'random.%d.log' % n))
+            random_threadpool_log(logs[-1], ctx.seed * 1000 + n)
+        failed += check_threadpool(logs, ctx.jobs)
+    finally:
+        shutil.rmtree(scratch)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/python
+
+# Joins client objecter log lines (debug objecter = 10 or higher) to the
+# osd op tracker requests built by log_analyzer.py, to split the latency a
+# client sees into time spent in the osds and time spent on the wire and in
+# the objecter.
+#
+# A client op is keyed by (entity name, tid), which is what an osd reqid such
+# as client.4123.0:5 is made of.  The client's submit and reply stamps use
+# the client's clock, and the primary's first event and the sending of its
+# reply use the primary's.  An ondisk reply is sent at the primary's
+# commit_sent, which comes before its 'done'; any other reply is taken to be
+# sent at the primary's last event.  So each op is also a round trip that
+# bounds the offset between the two clocks (see clockskew.py).  The outbound
+# and return legs are computed with the offset estimated so far, and are
+# left out while the bounds are crossed, which leaves no offset to take out.
+# They can be negative, so they are kept in loghist.SignedHistograms.
+# Entries are dropped once complete or after the idle window, so memory
+# follows the ops in flight.
+
+import clockskew
+import loghist
+import logio
+import symbols
+
+# Legs reported per client, in report order.
+LEGS = ['client', 'osd', 'network', 'outbound', 'return']
+
+LEG_TITLES = {
+    'client': 'client-observed latency',
+    'osd': 'primary osd residence',
+    'network': 'client minus osd residence',
+    'outbound': 'submit to first osd event',
+    'return': 'osd reply sent to reply',
+    }
+
+# Legs that can come out negative.
+SIGNED_LEGS = frozenset(['network', 'outbound', 'return'])
+
+COMMIT_SENT = symbols.EVENTS.code('commit_sent')
+
+PERCENTILES = [50, 99]
+
+# Text every objecter line holds, for searching mapped logs.
+OBJECTER_MARKER = '.objecter '
+
+def parse_objecter_line(line):
+    # Lines look like:
+    #   STAMP THREAD 10 client.4123.objecter _op_submit oid ... tid 5 osd.1
+    #   STAMP THREAD 10 client.4123.objecter handle_osd_op_reply 5 ondisk ...
+    at = line.find(OBJECTER_MARKER)
+    if at < 0:
+        return None
+    rest = line[at + 10:]
+    try:
+        if rest.startswith('_op_submit '):
+            tid_at = rest.find(' tid ')
+            if tid_at < 0:
+                return None
+            tid = int(rest[tid_at + 5:].split(None, 1)[0])
+            kind = 'submit'
+        elif rest.startswith('handle_osd_op_reply '):
+            fields = rest.split(None, 3)
+            tid = int(fields[1])
+            kind = fields[2]
+        else:
+            return None
+        retval = {}
+        retval['name'] = line[line.rfind(' ', 0, at) + 1:at]
+        retval['tid'] = tid
+        retval['time'] = logio.log_time(line[:26])
+        retval['kind'] = kind
+    except (ValueError, IndexError):
+        return None
+    return retval
+
+def read_objecter_events(client, func):
+    # Lazily yield the parsed objecter lines of one client log.
+    with func() as f:
+        for line in f:
+            parsed = parse_objecter_line(line)
+            if not parsed:
+                continue
+            parsed['client'] = client
+            yield parsed
+
+def reqid_key(reqid):
+    # 'client.4123.0:5' -> ('client.4123', 5)
+    try:
+        who, tid = reqid.rsplit(':', 1)
+        return (who.rsplit('.', 1)[0], int(tid))
+    except ValueError:
+        return None
+
+class PendingOp(object):
+    __slots__ = ('client', 'submit', 'reply', 'committed', 'req', 'touched')
+
+    def __init__(self, touched):
+        self.client = None
+        self.submit = None
+        self.reply = None
+        self.committed = False
+        self.req = None
+        self.touched = touched
+
+class ClientCorrelator(object):
+    def __init__(self, idle):
+        # idle is in microseconds of log time.
+        self.idle = idle
+        self.pending = {}
+        self.names = set()
+        self.offsets = {}
+        self.latency = {}
+        self.unmatched = 0
+        self.crossed = 0
+        self.now = None
+        self.last_sweep = None
+
+    def entry(self, key, time):
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = PendingOp(time)
+            self.pending[key] = entry
+        entry.touched = time
+        return entry
+
+    def add_client(self, parsed):
+        key = (parsed['name'], parsed['tid'])
+        self.names.add(parsed['name'])
+        if parsed['kind'] == 'submit':
+            entry = self.entry(key, parsed['time'])
+            if entry.submit is None:
+                entry.client = parsed['client']
+                entry.submit = parsed['time']
+        elif key in self.pending:
+            entry = self.entry(key, parsed['time'])
+            entry.reply = parsed['time']
+            if parsed['kind'] == 'ondisk':
+                entry.committed = True
+        else:
+            return
+        self.advance(parsed['time'])
+        if entry.committed and entry.req is not None:
+            self.finish(key)
+
+    def add_request(self, req):
+        # Tracker sink for the finished osd side of an op.
+        key = reqid_key(req.reqid)
+        if key is None or key[0] not in self.names:
+            return
+        entry = self.entry(key, req.last_event)
+        entry.req = req
+        self.advance(req.last_event)
+        if entry.committed:
+            self.finish(key)
+
+    def advance(self, now):
+        if self.last_sweep is None:
+            self.last_sweep = now
+        elif now - self.last_sweep >= self.idle:
+            self.last_sweep = now
+            for key, entry in self.pending.items():
+                if now - entry.touched >= self.idle:
+                    self.finish(key)
+
+    def flush(self):
+        for key in self.pending.keys():
+            self.finish(key)
+
+    def finish(self, key):
+        entry = self.pending.pop(key)
+        if entry.submit is None or entry.reply is None or entry.req is None:
+            self.unmatched += 1
+            return
+        req = entry.req
+        primary = req.primary()
+        if primary == -1:
+            primary = req.events[0][2]
+        events = [(time, event) for time, event, osd in req.events
+                  if osd == primary]
+        first = events[0][0]
+        sent = events[-1][0]
+        if entry.committed:
+            sent = None
+            for time, event in events:
+                if event == COMMIT_SENT:
+                    sent = time
+                    break
+            if sent is None:
+                # The primary's later events may follow the reply.
+                self.unmatched += 1
+                return
+        bounds = self.offsets.get((entry.client, primary))
+        if bounds is None:
+            bounds = clockskew.OffsetBounds()
+            self.offsets[(entry.client, primary)] = bounds
+        bounds.exchange(entry.submit, first, sent, entry.reply)
+        hists = self.latency.get(entry.client)
+        if hists is None:
+            hists = dict((leg, loghist.SignedHistogram() if leg in SIGNED_LEGS
+                          else loghist.LogHistogram()) for leg in LEGS)
+            self.latency[entry.client] = hists
+        client = entry.reply - entry.submit
+        hists['client'].add(client)
+        hists['osd'].add(sent - first)
+        hists['network'].add(client - (sent - first))
+        if not bounds.consistent():
+            self.crossed += 1
+            return
+        offset = bounds.estimate()
+        hists['outbound'].add(first - offset - entry.submit)
+        hists['return'].add(entry.reply - (sent - offset))
+
+    def output(self):
+        # below 0 is the share of negative samples of the signed legs.
+        print "Client latency breakdown (ms)"
+        print "%-10s %-28s %10s %8s" % ("client", "leg", "count",
+                                        "below 0") + \
+            "".join("%9s" % ("p%d" % p) for p in PERCENTILES) + \
+            "%9s" % "max"
+        for client in sorted(self.latency):
+            for leg in LEGS:
+                hist = self.latency[client][leg]
+                if leg not in SIGNED_LEGS:
+                    below = "-"
+                elif hist.count:
+                    below = "%.1f%%" % (100.0 * hist.negative.count /
+                                        hist.count)
+                else:
+                    below = "n/a"
+                print "%-10s %-28s %10d %8s" % (
+                    "client.%d" % client, LEG_TITLES[leg], hist.count,
+                    below) + \
+                    "".join("%9.3f" % (v / 1000.0) for v in
+                            hist.percentiles(PERCENTILES)) + \
+                    "%9.3f" % ((hist.max or 0) / 1000.0)
+        print "unmatched ops: %d" % self.unmatched
+        print "ops without outbound/return legs, clock bounds crossed: %d" % \
+            self.crossed
+        print ""
+        # Crossed bounds (lower above upper) leave no offset that fits every
+        # round trip, so no estimate is printed for them.
+        print "Clock offsets, osd minus client (ms)"
+        print "%-10s %-7s %10s %12s %12s %12s %12s" % (
+            "client", "osd", "samples", "lower", "upper", "offset", "+/-")
+        for (client, osd), bounds in sorted(self.offsets.iteritems()):
+            limits = ["n/a" if limit is None else "%.3f" % (limit / 1000.0)
+                      for limit in [bounds.lower, bounds.upper]]
+            uncertainty = bounds.uncertainty()
+            if not bounds.consistent():
+                offset, uncertainty = "crossed", "n/a"
+            else:
+                offset = "%.3f" % (bounds.estimate() / 1000.0)
+                uncertainty = "n/a" if uncertainty is None else \
+                    "%.3f" % (uncertainty / 1000.0)
+            print "%-10s %-7s %10d %12s %12s %12s %12s" % (
+                "client.%d" % client, "osd.%d" % osd, bounds.samples,
+                limits[0], limits[1], offset, uncertainty)
+        print ""
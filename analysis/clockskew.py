@@ -0,0 +1,184 @@
+#!/usr/bin/python
+
+# Clock offset estimation between hosts whose logs are compared.
+#
+# Ordered event pairs bound the offset between two clocks.  If something
+# is logged at a on clock A and something that it caused is logged at b on
+# clock B, then offset = B - A satisfies offset <= b - a.  An event on B that
+# causes one on A gives offset >= b - a.  OffsetBounds keeps the tightest
+# bounds seen and estimates the offset as their midpoint, with half the gap
+# as the uncertainty.
+#
+# OsdOffsets collects such bounds between the osds of replicated requests
+# and solves them for one offset per osd.
+
+class OffsetBounds(object):
+    __slots__ = ('lower', 'upper', 'samples')
+
+    def __init__(self):
+        self.lower = None
+        self.upper = None
+        self.samples = 0
+
+    def before(self, a, b):
+        # Event at a on clock A happened before event at b on clock B.
+        if self.upper is None or b - a < self.upper:
+            self.upper = b - a
+        self.samples += 1
+
+    def after(self, a, b):
+        # Event at a on clock A happened after event at b on clock B.
+        if self.lower is None or b - a > self.lower:
+            self.lower = b - a
+        self.samples += 1
+
+    def exchange(self, a_send, b_recv, b_send, a_recv):
+        # A round trip: A sends, B receives, B answers, A gets the answer.
+        self.before(a_send, b_recv)
+        self.after(a_recv, b_send)
+
+    def estimate(self):
+        if self.lower is None and self.upper is None:
+            return 0
+        if self.lower is None:
+            return self.upper
+        if self.upper is None:
+            return self.lower
+        return (self.lower + self.upper) // 2
+
+    def uncertainty(self):
+        # None while the offset is only bounded on one side.
+        if self.lower is None or self.upper is None:
+            return None
+        return abs(self.upper - self.lower) / 2.0
+
+    def consistent(self):
+        # Clocks that drift during the run can make the bounds cross.
+        return self.lower is None or self.upper is None or \
+            self.lower <= self.upper
+
+class OsdOffsets(object):
+    # Bounds the clock offset of every replica against its primary from the
+    # replicated writes in op tracker requests.  The primary logs 'waiting
+    # for subops' before a replica can see the sub op, and the replica logs
+    # 'commit_sent' before the primary logs 'sub_op_commit_rec' for it.
+    def __init__(self):
+        self.pairs = {}
+
+    def add_request(self, events, primary):
+        # events is a time ordered [(time, event, osd)], as Request.events.
+        if primary == -1:
+            return
+        sent = None
+        received = {}
+        received_last = None
+        first = {}
+        committed = {}
+        for time, event, osd in events:
+            if osd == primary:
+                if sent is None and event.startswith('waiting for subops'):
+                    sent = time
+                elif event.startswith('sub_op_commit_rec'):
+                    received_last = time
+                    source = event[len('sub_op_commit_rec'):].split()
+                    if len(source) == 2 and source[0] == 'from':
+                        try:
+                            received[int(source[1].split('(')[0])] = time
+                        except ValueError:
+                            pass
+            else:
+                if osd not in first:
+                    first[osd] = time
+                if event == 'commit_sent':
+                    committed[osd] = time
+        for osd in first:
+            bounds = self.pairs.get((primary, osd))
+            if bounds is None:
+                bounds = OffsetBounds()
+                self.pairs[(primary, osd)] = bounds
+            if sent is not None:
+                bounds.before(sent, first[osd])
+            # Without a 'from N' suffix only the last commit_rec is known
+            # to follow this replica's commit.
+            reply = received.get(osd, received_last)
+            if reply is not None and osd in committed:
+                bounds.after(reply, committed[osd])
+
+    def edges(self):
+        # Pairwise (a, b, offset of b relative to a, half width) for every
+        # pair bounded on both sides, with both directions folded together.
+        folded = {}
+        for (a, b), bounds in self.pairs.iteritems():
+            if a > b:
+                a, b = b, a
+                flipped = OffsetBounds()
+                if bounds.upper is not None:
+                    flipped.lower = -bounds.upper
+                if bounds.lower is not None:
+                    flipped.upper = -bounds.lower
+                bounds = flipped
+            pair = folded.get((a, b))
+            if pair is None:
+                pair = OffsetBounds()
+                folded[(a, b)] = pair
+            if bounds.upper is not None and (pair.upper is None or
+                                             bounds.upper < pair.upper):
+                pair.upper = bounds.upper
+            if bounds.lower is not None and (pair.lower is None or
+                                             bounds.lower > pair.lower):
+                pair.lower = bounds.lower
+        return [(a, b, bounds.estimate(), bounds.uncertainty())
+                for (a, b), bounds in sorted(folded.iteritems())
+                if bounds.uncertainty() is not None]
+
+    def solve(self, osds, iterations=1000):
+        # Weighted least squares fit of per-osd offsets to the pairwise
+        # estimates, by Gauss-Seidel.  The lowest osd of each connected group
+        # is the reference, at 0.  Returns {osd: (offset, bound, residual)}
+        # where bound is the tightest pairwise half width the osd took part
+        # in and residual the RMS misfit of its pairs; both are None for an
+        # osd with no usable pair.
+        edges = self.edges()
+        links = dict((osd, []) for osd in osds)
+        for a, b, delta, width in edges:
+            weight = 1.0 / (width + 1) ** 2
+            links.setdefault(a, []).append((b, delta, weight))
+            links.setdefault(b, []).append((a, -delta, weight))
+        offsets = {}
+        fixed = set()
+        for root in sorted(links):
+            if root in offsets:
+                continue
+            # Seed the group by walking out from its reference osd.
+            offsets[root] = 0.0
+            fixed.add(root)
+            todo = [root]
+            while todo:
+                osd = todo.pop()
+                for other, delta, weight in links[osd]:
+                    if other not in offsets:
+                        offsets[other] = offsets[osd] + delta
+                        todo.append(other)
+        for _ in xrange(iterations):
+            moved = 0.0
+            for osd in sorted(links):
+                if osd in fixed or not links[osd]:
+                    continue
+                total = sum(weight for _, _, weight in links[osd])
+                value = sum((offsets[other] - delta) * weight
+                            for other, delta, weight in links[osd]) / total
+                moved = max(moved, abs(value - offsets[osd]))
+                offsets[osd] = value
+            if moved < 0.5:
+                break
+        result = {}
+        for osd in links:
+            if not links[osd]:
+                result[osd] = (0, None, None)
+                continue
+            misfit = [(offsets[osd] - offsets[other] + delta) ** 2
+                      for other, delta, _ in links[osd]]
+            widths = [width for a, b, _, width in edges if osd in (a, b)]
+            result[osd] = (int(round(offsets[osd])), min(widths),
+                           (sum(misfit) / len(misfit)) ** 0.5)
+        return result
@@ -1,26 +1,73 @@
 #!/usr/bin/python
 
-import gzip
+# This program is used to parse ceph osd logs with op tracker debugging
+# (debug optracker = 5 or higher) and report per-request latencies.
+#
+# Usage:
+#
+# log_analyzer.py [--stream] [--idle SECONDS] [--jobs N] [--export FILE]
+#                 [--phases] [--slowest K] [--osd N] [--primary N]
+#                 [--replicas N,N,...] [--follow SECONDS] [--cache]
+#                 [--cache-dir DIR] [--no-gz-pipeline] [--clients]
+#                 [--align-clocks] [--grace SECONDS] [--series FILE]
+#                 [--series-width SECONDS] [--no-mmap] LOG_DIR
+
+import argparse
+import collections
+import functools
+import heapq
+import multiprocessing
 import os
 import os.path
 import re
 import sys
-import datetime
-from datetime import datetime
+from time import sleep, strftime, time as wall_time
+
+import client_correlation
+import clockskew
+import loghist
+import logio
+import symbols
+import tracker_cache
+import tracker_columns
+import tracker_series
+
+# Events after which an osd is finished with a request.
+TERMINAL_EVENTS = ['done']
+
+# Request events hold event codes from symbols.EVENTS.
+TERMINAL_CODES = frozenset(symbols.EVENTS.remap(TERMINAL_EVENTS))
+OP_APPLIED = symbols.EVENTS.code('op_applied')
+
+# Text every op tracker line holds, for searching mapped logs.
+TRACKER_MARKER = 'reqid: '
+
+# Seconds of log time a complete request is held before it is finished.
+GRACE = 1.0
+
+# Default parse cache directory, inside the log directory.
+CACHE_DIR = '.log_analyzer_cache'
+
+# Number of slowest requests to pretty print.
+SLOWEST = 99
+
+# Number of slowest requests listed per --follow interval.
+FOLLOW_SLOWEST = 5
+
+# A plain osd log, as --follow looks for new ones.
+OSD_LOG = re.compile(r'osd\.([0-9]+)\.log$')
 
-tracker_regex = re.compile('.*reqid: (.+), seq: ([0-9]+), time: (\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d\.\d\d\d\d\d\d), event: (.*), request: (.*)')
+# Percentiles shown in the phase breakdown.
+PHASE_PERCENTILES = [50, 90, 99]
 
 def wrapgz(gfilename):
     def retval():
-        gfile = gzip.open(gfilename, 'rb')
-        gfile.__exit__ = lambda: gfile.close()
-        return gfile
+        return logio.open_gz(gfilename)
     return (gfilename, retval)
 
-def wrap(filename):
+def wrap(filename, marker=None):
     def retval():
-        nfile = open(filename, 'rb')
-        return nfile
+        return logio.open_plain(filename, marker)
     return (filename, retval)
 
 def get_logs(path):
@@ -39,7 +86,7 @@ def get_logs(path):
             if match and not int(match.group(1)) in output['osd']:
                 fn = os.path.join(path, filename)
                 output['osd'][int(match.group(1))] = wrap(
-                    os.path.join(path, filename))
+                    os.path.join(path, filename), TRACKER_MARKER)
             match = re.match('client.([0-9]+).log.gz', filename)
             if match:
                 fn = os.path.join(path, filename)
@@ -49,63 +96,326 @@ def get_logs(path):
             if match and not int(match.group(1)) in output['client']:
                 fn = os.path.join(path, filename)
                 output['client'][int(match.group(1))] = wrap(
-                    os.path.join(path, filename))
+                    os.path.join(path, filename),
+                    client_correlation.OBJECTER_MARKER)
     return output
 
+def open_log(filename, marker=None):
+    if filename.endswith('.gz'):
+        return wrapgz(filename)[1]()
+    return wrap(filename, marker)[1]()
+
 def parse_tracker_line(line):
-    retval = {}
-    match = tracker_regex.match(line)
-    if match:
-        retval['reqid'] = match.group(1)
-        retval['seq'] = int(match.group(2))
-        retval['time'] = datetime.strptime(
-            match.group(3), '%Y-%m-%d %H:%M:%S.%f'
-            )
-        retval['event'] = match.group(4)
-        retval['request'] = match.group(5)
-        return retval
-    return None
-
-class Request:
-    def __init__(self):
-        self.parsed = []
-        self.events = []
+    # Lines look like:
+    #   ... reqid: R, seq: N, time: YYYY-mm-dd HH:MM:SS.ffffff, event: E, request: D
+    # The fields are cut out with find() and slicing rather than a regex;
+    # lines without the reqid marker are rejected before anything else.
+    # Only reqid, time and event are kept: nothing reads seq or request.
+    start = line.find(TRACKER_MARKER)
+    if start < 0:
+        return None
+    seq_at = line.find(', seq: ', start)
+    time_at = line.find(', time: ', seq_at)
+    request_at = line.find(', request: ', time_at)
+    if seq_at < 0 or time_at < 0 or request_at < 0 or \
+       line[time_at + 34:time_at + 43] != ', event: ':
+        return None
+    try:
+        retval = {}
+        retval['reqid'] = line[start + 7:seq_at]
+        retval['time'] = logio.log_time(line[time_at + 8:time_at + 34])
+        retval['event'] = line[time_at + 43:request_at]
+    except ValueError:
+        return None
+    return retval
+
+def read_tracker_events(osd, func):
+    # Lazily yield the parsed tracker lines of one osd log.
+    with func() as f:
+        for line in f:
+            parsed = parse_tracker_line(line)
+            if not parsed or parsed['reqid'] == 'unknown.0.0:0':
+                continue
+            parsed['osd'] = osd
+            yield parsed
+
+def cached_tracker_events(osd, fn, func, cache):
+    # read_tracker_events() through the parse cache, when there is one.  A
+    # log without a usable entry is parsed and its entry written once the
+    # whole log has been read.
+    if cache is None:
+        for parsed in read_tracker_events(osd, func):
+            yield parsed
+        return
+    table = cache.load(fn)
+    if table is not None:
+        for reqid, time, event in table:
+            yield {'reqid': reqid, 'time': time, 'event': event, 'osd': osd}
+        return
+    stamp = tracker_cache.fingerprint(fn)
+    table = tracker_cache.EventTable()
+    for parsed in read_tracker_events(osd, func):
+        table.append(parsed['reqid'], parsed['time'], parsed['event'])
+        yield parsed
+    cache.store(fn, stamp, table)
+
+def _shifted(events, offset):
+    # Move one osd's events onto the reference clock.
+    for parsed in events:
+        parsed['time'] -= offset
+        yield parsed
+
+def osd_tracker_events(osd, fn, func, cache=None, offsets=None):
+    events = cached_tracker_events(osd, fn, func, cache)
+    if offsets and offsets.get(osd):
+        events = _shifted(events, offsets[osd])
+    return events
+
+def _time_keyed(source, events):
+    for n, parsed in enumerate(events):
+        yield (parsed['time'], source, n, parsed)
+
+def merged_log_events(osd_logs, client_logs=None, cache=None, offsets=None):
+    # Merge the per-osd, and per-client, streams into one stream of
+    # ('osd', parsed) and ('client', parsed) ordered by event time.  Each log
+    # is already in time order, so only one line per log is buffered.
+    streams = [_time_keyed(('osd', i), osd_tracker_events(i, fn, func, cache,
+                                                          offsets))
+               for i, (fn, func) in sorted(osd_logs.iteritems())]
+    streams += [_time_keyed(('client', i),
+                            client_correlation.read_objecter_events(i, func))
+                for i, (fn, func) in sorted((client_logs or {}).iteritems())]
+    for _, (kind, _), _, parsed in heapq.merge(*streams):
+        yield (kind, parsed)
+
+def merged_tracker_events(osd_logs, cache=None, offsets=None):
+    for _, parsed in merged_log_events(osd_logs, cache=cache,
+                                       offsets=offsets):
+        yield parsed
+
+def serial_tracker_events(osd_logs, cache=None, offsets=None):
+    for i, (fn, func) in sorted(osd_logs.iteritems()):
+        for parsed in osd_tracker_events(i, fn, func, cache, offsets):
+            yield parsed
+
+class LogTail:
+    # Hands out the complete lines appended to a log since the last read.
+    # Only the byte offset and an unterminated last line are kept, so each
+    # read costs what was appended, not the size of the file.
+    def __init__(self, filename, from_start=False):
+        self.filename = filename
+        self.offset = 0
+        if not from_start:
+            self.offset = os.path.getsize(filename)
+        self.partial = ''
+
+    def read(self):
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            return []
+        if size < self.offset:
+            # Truncated or rotated, start over.
+            self.offset = 0
+            self.partial = ''
+        if size == self.offset:
+            return []
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        return lines
+
+class FollowedLogs:
+    # The plain osd logs under log_dir, tailed for --follow.  The tree is
+    # walked once, on the first poll; later polls only list log_dir and the
+    # directories logs were found in, and read the logs that show up there
+    # from their beginning.
+    def __init__(self, log_dir):
+        self.log_dir = os.path.abspath(log_dir)
+        self.dirs = None
+        self.tails = {}
+        # osds get_logs() found a gzipped log of, which are not followed.
+        self.skipped = set()
+
+    def find(self):
+        if self.dirs is None:
+            self.dirs = set([self.log_dir])
+            for osd, (fn, func) in get_logs(self.log_dir)['osd'].iteritems():
+                if fn.endswith('.gz'):
+                    self.skipped.add(osd)
+                    continue
+                self.tails[osd] = LogTail(fn)
+                self.dirs.add(os.path.dirname(fn))
+            return
+        for path in sorted(self.dirs):
+            try:
+                files = os.listdir(path)
+            except OSError:
+                continue
+            for filename in files:
+                match = OSD_LOG.match(filename)
+                if not match:
+                    continue
+                osd = int(match.group(1))
+                if osd not in self.tails and osd not in self.skipped:
+                    self.tails[osd] = LogTail(os.path.join(path, filename),
+                                              from_start=True)
+
+    def poll(self):
+        # The tracker lines appended since the last poll, ordered by event
+        # time.
+        self.find()
+        batch = []
+        for osd, tail in sorted(self.tails.iteritems()):
+            for line in tail.read():
+                parsed = parse_tracker_line(line)
+                if not parsed or parsed['reqid'] == 'unknown.0.0:0':
+                    continue
+                parsed['osd'] = osd
+                batch.append((parsed['time'], osd, len(batch), parsed))
+        batch.sort()
+        return [parsed for _, _, _, parsed in batch]
+
+def parse_osd_log(job):
+    # Worker for the process pool: parse one osd log, or one byte range of
+    # a plain one, into per-reqid event lists, in log order, for the parent
+    # to merge.  Ranges bypass the cache, which holds whole logs.  Events
+    # are coded against a table of the worker's own, returned with them.
+    osd, filename, cache_dir, offset, byte_range = job
+    if byte_range is not None:
+        start, end = byte_range
+        events = osd_tracker_events(
+            osd, filename, functools.partial(
+                logio.MappedLog, filename, TRACKER_MARKER, start, end),
+            None, {osd: offset})
+    else:
+        cache = None
+        if cache_dir:
+            cache = tracker_cache.ParseCache(cache_dir)
+        events = osd_tracker_events(
+            osd, filename, functools.partial(open_log, filename,
+                                             TRACKER_MARKER),
+            cache, {osd: offset})
+    names = symbols.SymbolTable()
+    partial = {}
+    for parsed in events:
+        if parsed['reqid'] not in partial:
+            partial[parsed['reqid']] = []
+        partial[parsed['reqid']].append((parsed['time'],
+                                         names.code(parsed['event'])))
+    return (osd, names.names, partial)
+
+def osd_log_jobs(osd_logs, jobs, cache_dir=None, offsets=None):
+    # One job per osd log, except that without the cache large plain logs
+    # are split into a range per worker.  Jobs are in osd and then file
+    # order.
+    offsets = offsets or {}
+    retval = []
+    for i, (fn, func) in sorted(osd_logs.iteritems()):
+        if cache_dir or not logio.MMAP or fn.endswith('.gz'):
+            retval.append((i, fn, cache_dir, offsets.get(i, 0), None))
+            continue
+        for byte_range in logio.line_ranges(fn, jobs):
+            retval.append((i, fn, None, offsets.get(i, 0), byte_range))
+    return retval
+
+def parallel_tracker_events(osd_logs, jobs, cache_dir=None, offsets=None):
+    # Yield (osd, event names, partial) results in job order so that
+    # merging them gives exactly the state the serial path builds.
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(parse_osd_log, osd_log_jobs(
+                osd_logs, jobs, cache_dir, offsets)):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+class Request(object):
+    # Events are appended as they arrive and only put in order when the
+    # request is finished or first read, instead of re-sorting on every add.
+    # Events are (time, event code, osd); see symbols.EVENTS.
+    __slots__ = ('reqid', '_events', '_sorted', 'last_event', 'first_event',
+                 '_primary', 'osds', 'finished')
+
+    def __init__(self, reqid):
+        self.reqid = reqid
+        self._events = []
+        self._sorted = True
         self.last_event = None
         self.first_event = None
         self._primary = -1
         self.osds = []
-        
+        self.finished = []
 
     def add_event(self, parsed):
-        if self.parsed == []:
-            self.last_event = parsed['time']
-            self.first_event = parsed['time']
-        self.parsed.append(parsed)
-        self.events.append((parsed['time'], parsed['event'], parsed['osd']))
-        self.events.sort()
-        if self.last_event < parsed['time']:
-            self.last_event = parsed['time']
-        if self.first_event > parsed['time']:
-            self.first_event = parsed['time']
-        if parsed['event'] == 'op_applied':
-            self._primary = parsed['osd']
-        if parsed['osd'] not in self.osds:
-            self.osds.append(parsed['osd'])
+        self.add(parsed['time'], symbols.EVENTS.code(parsed['event']),
+                 parsed['osd'])
+
+    def add(self, time, event, osd):
+        if not self._events:
+            self.last_event = time
+            self.first_event = time
+        elif self.last_event < time:
+            self.last_event = time
+        elif self.first_event > time:
+            self.first_event = time
+        self._events.append((time, event, osd))
+        self._sorted = False
+        if event == OP_APPLIED:
+            self._primary = osd
+        if osd not in self.osds:
+            self.osds.append(osd)
+        if event in TERMINAL_CODES and osd not in self.finished:
+            self.finished.append(osd)
+
+    def finalize(self):
+        if not self._sorted:
+            self._events.sort()
             self.osds.sort()
+            self._sorted = True
+
+    @property
+    def events(self):
+        self.finalize()
+        return self._events
+
+    def named_events(self):
+        # events with the event names in place of their codes.
+        names = symbols.EVENTS.names
+        return [(time, names[event], osd) for time, event, osd in self.events]
+
+    def span(self, osd):
+        # First and last event time on one osd, by that osd's clock.
+        times = [time for time, event, o in self.events if o == osd]
+        if not times:
+            return None
+        return (times[0], times[-1])
+
+    def complete(self):
+        # Every osd that has touched the request has logged a terminal event.
+        return len(self.finished) == len(self.osds)
 
     def duration(self):
-        return (self.last_event - self.first_event).total_seconds()
+        self.finalize()
+        return (self.last_event - self.first_event) / 1000000.0
 
     def __repr__(self):
-        return str(self.events) + " " + \
-               str(self.duration()) + " " + self.parsed[0]['reqid']
+        return str(self.named_events()) + " " + \
+               str(self.duration()) + " " + self.reqid
 
     def pretty_print(self):
         outstr = "reqid: %s, duration: %s"%(
-            self.parsed[0]['reqid'],str(self.duration()))
+            self.reqid,str(self.duration()))
         outstr += "\n=====================\n"
-        for (time, event, osd) in self.events:
-            outstr += "%s (osd.%s): %s\n"%(str(time), str(osd), event)
+        for (time, event, osd) in self.named_events():
+            outstr += "%s (osd.%s): %s\n"%(logio.format_time(time), str(osd), event)
         outstr += "=====================\n"
         return outstr
 
@@ -113,41 +423,518 @@ class Request:
         return self._primary
 
     def replicas(self):
+        self.finalize()
         return self.osds
-        
 
-requests = {}
+class Tracker:
+    # Keeps the in-flight requests and hands each one to sink once it is
+    # finished.  Without an idle window nothing is finished before flush(),
+    # which is what the serial, one osd at a time, ingestion needs.
+    #
+    # A complete request is held for a grace period before it is finished:
+    # with skewed clocks a replica's events can sort after the primary's
+    # 'done', and finishing early would split the request in two.
+    def __init__(self, sink, idle=None, grace=GRACE):
+        self.requests = {}
+        self.sink = sink
+        self.idle = idle
+        self.grace = grace * 1000000
+        self.completed = collections.deque()
+        self.queued = {}
+        self.last_sweep = None
 
-logs = get_logs(sys.argv[1])
+    def get(self, reqid):
+        req = self.requests.get(reqid)
+        if req is None:
+            req = Request(reqid)
+            self.requests[reqid] = req
+        return req
 
-for i, (fn, func) in logs['osd'].iteritems():
-    with func() as f:
-        for line in f.readlines():
-            parsed = parse_tracker_line(line)
-            if not parsed or parsed['reqid'] == 'unknown.0.0:0':
+    def add_partial(self, osd, names, partial):
+        # Merge one osd's worth of per-reqid events from parse_osd_log(),
+        # coded against the worker's event names.
+        codes = symbols.EVENTS.remap(names)
+        for reqid, events in partial.iteritems():
+            req = self.get(reqid)
+            for time, event in events:
+                req.add(time, codes[event], osd)
+
+    def add_event(self, parsed):
+        req = self.get(parsed['reqid'])
+        req.add_event(parsed)
+        if self.idle is None:
+            return
+        now = parsed['time']
+        self.queued.pop(req.reqid, None)
+        if req.complete():
+            self.queued[req.reqid] = now
+            self.completed.append((now, req))
+        self.advance(now)
+
+    def advance(self, now):
+        # Finish the requests whose grace period or idle window is over at
+        # log time now.
+        while self.completed and now - self.completed[0][0] >= self.grace:
+            queued, req = self.completed.popleft()
+            if self.queued.get(req.reqid) == queued and \
+               self.requests.get(req.reqid) is req:
+                self.finish(req)
+        if self.last_sweep is None:
+            self.last_sweep = now
+        elif now - self.last_sweep >= self.idle * 1000000:
+            self.sweep(now)
+
+    def finish(self, req):
+        del self.requests[req.reqid]
+        self.queued.pop(req.reqid, None)
+        req.finalize()
+        self.sink(req)
+
+    def sweep(self, now):
+        # Finish requests that have not seen an event for the idle window.
+        self.last_sweep = now
+        for reqid, req in self.requests.items():
+            if now - req.last_event >= self.idle * 1000000:
+                self.finish(req)
+
+    def flush(self):
+        for reqid in sorted(self.requests):
+            self.requests[reqid].finalize()
+            self.sink(self.requests[reqid])
+        self.requests = {}
+        self.completed.clear()
+        self.queued = {}
+
+class TopK:
+    # The k slowest requests that pass the filters, kept in a min-heap keyed
+    # by duration: each request costs O(log k) and memory stays O(k).
+    def __init__(self, k=SLOWEST, osd=None, primary=None, replicas=None):
+        self.k = k
+        self.osd = osd
+        self.primary = primary
+        self.replicas = replicas
+        self.heap = []
+
+    def wanted(self, req):
+        if self.osd is not None and self.osd not in req.replicas():
+            return False
+        if self.primary is not None and self.primary != req.primary():
+            return False
+        if self.replicas is not None and self.replicas != req.replicas():
+            return False
+        return True
+
+    def add(self, req):
+        if self.k <= 0 or not self.wanted(req):
+            return
+        item = (req.duration(), req.reqid, req)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def slowest(self):
+        return [req for _, _, req in sorted(self.heap, reverse=True)]
+
+class Report:
+    # Folds finished requests into the summaries as they arrive, keeping only
+    # the counters and the slowest requests.
+    def __init__(self, slowest=None):
+        self.pairs = {}
+        self.osds = {}
+        if slowest is None:
+            slowest = TopK()
+        self.slowest = slowest
+
+    def add(self, req):
+        replicas = tuple(req.replicas())
+        if replicas not in self.pairs:
+            self.pairs[replicas] = 0
+        self.pairs[replicas] += 1
+        if req.primary() not in self.osds:
+            self.osds[req.primary()] = 0
+        self.osds[req.primary()] += 1
+        self.slowest.add(req)
+
+    def output(self):
+        print self.pairs
+        print self.osds
+        for req in self.slowest.slowest():
+            print req.pretty_print()
+
+class IntervalSummary:
+    # Latency of the requests finished since the last output, for --follow.
+    def __init__(self, slowest=FOLLOW_SLOWEST):
+        self.k = slowest
+        self.reset()
+
+    def reset(self):
+        self.latency = loghist.LogHistogram()
+        self.slowest = TopK(self.k)
+
+    def add(self, req):
+        self.latency.add(req.last_event - req.first_event)
+        self.slowest.add(req)
+
+    def output(self, in_flight):
+        p50, p99 = self.latency.percentiles([50, 99])
+        print "%s done: %d in-flight: %d p50: %.3f ms p99: %.3f ms " \
+              "max: %.3f ms" % (
+              strftime('%Y-%m-%d %H:%M:%S'), self.latency.count,
+              in_flight, p50 / 1000.0, p99 / 1000.0,
+              (self.latency.max or 0) / 1000.0)
+        for req in self.slowest.slowest():
+            print "    %s %.3f ms primary: %d osds: %s" % (
+                req.reqid, req.duration() * 1000, req.primary(),
+                req.replicas())
+        sys.stdout.flush()
+        self.reset()
+
+class PhaseBreakdown:
+    # Time between consecutive events of a request on the same osd, kept as
+    # mergeable log-bucketed histograms per (role, phase, osd), so the
+    # samples themselves never have to be stored.
+    def __init__(self):
+        self.histograms = {}
+        self.order = []
+        self.names = {}
+
+    def phase_event(self, event):
+        # The name of event, a symbols.EVENTS code, with any osd ids folded
+        # out; see symbols.event_phase().
+        name = self.names.get(event)
+        if name is None:
+            name = symbols.event_phase(symbols.EVENTS.name(event))
+            self.names[event] = name
+        return name
+
+    def histogram(self, role, phase, osd):
+        key = (role, phase, osd)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = loghist.LogHistogram()
+            self.histograms[key] = hist
+            if (role, phase) not in self.order:
+                self.order.append((role, phase))
+        return hist
+
+    def add(self, req):
+        events = req.events
+        primary = req.primary()
+        if primary == -1 and events:
+            # Reads never log op_applied; the first osd to see it is primary.
+            primary = events[0][2]
+        last = {}
+        for time, event, osd in events:
+            event = self.phase_event(event)
+            prev = last.get(osd)
+            last[osd] = (time, event)
+            if prev is None:
                 continue
-            parsed['osd'] = i
-            if parsed['reqid'] not in requests:
-                requests[parsed['reqid']] = Request()
-            requests[parsed['reqid']].add_event(parsed)
-
-all_requests = [(i.duration(), i) for i in requests.itervalues()]
-all_requests.sort()
-
-pairs = {}
-for _, i in all_requests:
-    if tuple(i.replicas()) not in pairs:
-        pairs[tuple(i.replicas())] = 0
-    pairs[tuple(i.replicas())] += 1
-print pairs 
-
-osds = {}
-for _, i in all_requests:
-    if i.primary() not in osds:
-        osds[i.primary()] = 0
-    osds[i.primary()] += 1
-
-print osds
-
-for _, i in all_requests[:-100:-1]:
-    print i.pretty_print()
+            if osd == primary:
+                role = 'primary'
+            else:
+                role = 'replica'
+            self.histogram(role, '%s -> %s' % (prev[1], event),
+                           osd).add(time - prev[0])
+
+    def merge(self, other):
+        for (role, phase, osd), hist in other.histograms.iteritems():
+            self.histogram(role, phase, osd).merge(hist)
+        return self
+
+    def output(self):
+        width = max([len(phase) for role, phase in self.order] + [5])
+        print "Phase latency breakdown (ms)"
+        print "%-8s %-*s %-7s %10s %9s" % (
+            "role", width, "phase", "osd", "count", "mean") + \
+            "".join("%9s" % ("p%d" % p) for p in PHASE_PERCENTILES) + \
+            "%9s" % "max"
+        osds = sorted(set(osd for _, _, osd in self.histograms))
+        for role, phase in self.order:
+            rows = [("osd.%d" % osd, self.histograms[(role, phase, osd)])
+                    for osd in osds if (role, phase, osd) in self.histograms]
+            total = loghist.LogHistogram()
+            for _, hist in rows:
+                total.merge(hist)
+            for name, hist in [("all", total)] + rows:
+                print "%-8s %-*s %-7s %10d %9.3f" % (
+                    role, width, phase, name, hist.count,
+                    hist.mean() / 1000.0) + \
+                    "".join("%9.3f" % (v / 1000.0) for v in
+                            hist.percentiles(PHASE_PERCENTILES)) + \
+                    "%9.3f" % (hist.max / 1000.0)
+        print ""
+
+def estimate_offsets(osd_logs, cache, idle, grace):
+    # A streaming pass over the logs that solves the per-osd clock offsets
+    # from the replicated requests.
+    estimator = clockskew.OsdOffsets()
+    tracker = Tracker(lambda req: estimator.add_request(req.named_events(),
+                                                        req.primary()),
+                      idle, grace)
+    for parsed in merged_tracker_events(osd_logs, cache):
+        tracker.add_event(parsed)
+    tracker.flush()
+    return estimator.solve(osd_logs.keys())
+
+def print_offsets(solved):
+    print "Clock offsets relative to the reference osd (ms)"
+    print "%-7s %12s %12s %12s" % ("osd", "offset", "+/-", "residual")
+    for osd, (offset, bound, residual) in sorted(solved.iteritems()):
+        if bound is None:
+            print "%-7s %12s %12s %12s" % ("osd.%d" % osd, "unaligned",
+                                          "n/a", "n/a")
+        else:
+            print "%-7s %12.3f %12.3f %12.3f" % (
+                "osd.%d" % osd, offset / 1000.0, bound / 1000.0,
+                residual / 1000.0)
+    print ""
+
+def replica_set(value):
+    try:
+        return sorted(int(osd) for osd in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError('%s is not a list of osd ids' % value)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Report op tracker latencies from ceph osd logs.')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Merge the osd logs by time and finish requests as they '
+             'complete, so memory follows the in-flight requests.',
+        )
+    parser.add_argument(
+        '--idle',
+        type=float,
+        default=30.0,
+        help='With --stream, finish requests that have been idle for this '
+             'many seconds of log time (default 30).',
+        )
+    parser.add_argument(
+        '--grace',
+        type=float,
+        default=GRACE,
+        help='With --stream, hold a complete request this many seconds of '
+             'log time before finishing it, in case events from a skewed '
+             'osd clock are still to come (default %g).' % GRACE,
+        )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='Parse the osd logs in this many worker processes.',
+        )
+    parser.add_argument(
+        '--export',
+        metavar='FILE',
+        help='Also write every event as columns to FILE, either .npz or '
+             '.parquet; see tracker_columns.py.',
+        )
+    parser.add_argument(
+        '--phases',
+        action='store_true',
+        help='Also report the time between consecutive events per osd, '
+             'split by primary/replica role.',
+        )
+    parser.add_argument(
+        '--slowest',
+        type=int,
+        default=SLOWEST,
+        metavar='K',
+        help='Number of slowest requests to print (default %d).' % SLOWEST,
+        )
+    parser.add_argument(
+        '--osd',
+        type=int,
+        help='Only list slow requests that touched this osd.',
+        )
+    parser.add_argument(
+        '--primary',
+        type=int,
+        help='Only list slow requests with this primary osd.',
+        )
+    parser.add_argument(
+        '--replicas',
+        type=replica_set,
+        metavar='N,N,...',
+        help='Only list slow requests on exactly this set of osds.',
+        )
+    parser.add_argument(
+        '--follow',
+        type=float,
+        metavar='SECONDS',
+        help='Tail the plain osd logs, printing a latency summary and the '
+             'slowest new requests every SECONDS, until interrupted.  While '
+             'the logs are quiet, log time is taken to follow the wall clock '
+             'for --grace and --idle.',
+        )
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='Keep the parsed events of each osd log in %s inside LOG_DIR '
+             'and reuse them while the log is unchanged.' % CACHE_DIR,
+        )
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        help='Like --cache, but keep the cache in DIR.',
+        )
+    parser.add_argument(
+        '--no-gz-pipeline',
+        action='store_true',
+        help='Decompress gzipped logs with gzip.open() in the parsing '
+             'process instead of in a separate process or thread.',
+        )
+    parser.add_argument(
+        '--clients',
+        action='store_true',
+        help='Also read the client.N.log(.gz) objecter lines and split '
+             'client latency into osd and network time; implies --stream.',
+        )
+    parser.add_argument(
+        '--align-clocks',
+        action='store_true',
+        help='First estimate per-osd clock offsets from replicated writes, '
+             'then read the logs again with the offsets removed.',
+        )
+    parser.add_argument(
+        '--series',
+        metavar='FILE',
+        help='Write per-osd time series of completed ops, average ops in '
+             'flight and p50/p99 latency to FILE, as CSV or, for .npz, numpy '
+             'arrays.',
+        )
+    parser.add_argument(
+        '--series-width',
+        type=float,
+        default=1.0,
+        metavar='SECONDS',
+        help='Bucket width of the --series time series (default 1).',
+        )
+    parser.add_argument(
+        '--no-mmap',
+        action='store_true',
+        help='Read plain logs through open() instead of mmap; a log is '
+             'then never split between --jobs workers.',
+        )
+    parser.add_argument(
+        'log_dir',
+        help='Directory containing the osd.N.log(.gz) files.',
+        )
+    args = parser.parse_args()
+    if args.clients:
+        args.stream = True
+    if args.follow and args.align_clocks:
+        parser.error('--align-clocks needs complete logs, not --follow')
+    if args.follow and args.clients:
+        parser.error('--follow only tails the osd logs; it cannot be '
+                     'combined with --clients')
+    if args.jobs > 1 and (args.stream or args.follow):
+        parser.error('--stream, --follow and --clients merge the logs in one '
+                     'process; they cannot be combined with --jobs')
+    # Fail before the logs are read, not when the results are saved.
+    for option, filename, module in [
+            ('--export', args.export, tracker_columns),
+            ('--series', args.series, tracker_series)]:
+        missing = filename and module.missing_module(filename)
+        if missing:
+            parser.error('%s %s needs %s, which is not installed' % (
+                option, filename, missing))
+    if args.cache and not args.cache_dir:
+        args.cache_dir = os.path.join(args.log_dir, CACHE_DIR)
+    return args
+
+def main():
+    ctx = parse_args()
+    if ctx.no_gz_pipeline:
+        logio.PIPELINE = False
+    if ctx.no_mmap:
+        logio.MMAP = False
+    logs = get_logs(ctx.log_dir)
+    report = Report(TopK(ctx.slowest, ctx.osd, ctx.primary, ctx.replicas))
+    sinks = [report.add]
+    if ctx.export:
+        columns = tracker_columns.EventColumns()
+        sinks.append(columns.add)
+    if ctx.phases:
+        phases = PhaseBreakdown()
+        sinks.append(phases.add)
+    if ctx.series:
+        series = tracker_series.TrackerSeries(ctx.series_width)
+        sinks.append(series.add)
+    def sink(req):
+        for func in sinks:
+            func(req)
+    if ctx.clients:
+        correlator = client_correlation.ClientCorrelator(ctx.idle * 1000000)
+        sinks.append(correlator.add_request)
+    cache = None
+    if ctx.cache_dir:
+        cache = tracker_cache.ParseCache(ctx.cache_dir)
+    offsets = None
+    if ctx.align_clocks:
+        solved = estimate_offsets(logs['osd'], cache, ctx.idle, ctx.grace)
+        print_offsets(solved)
+        offsets = dict((osd, offset)
+                       for osd, (offset, _, _) in solved.iteritems())
+    if ctx.follow:
+        tracker = Tracker(sink, ctx.idle, ctx.grace)
+        interval = IntervalSummary()
+        sinks.append(interval.add)
+        followed = FollowedLogs(ctx.log_dir)
+        # The newest event time read and the wall clock time it was read
+        # at.  Log time is taken to go on with the wall clock while the
+        # logs are quiet, so requests still finish when the osds stall.
+        newest = None
+        try:
+            while True:
+                for parsed in followed.poll():
+                    tracker.add_event(parsed)
+                    if newest is None or parsed['time'] > newest[0]:
+                        newest = (parsed['time'], wall_time())
+                if newest is not None:
+                    tracker.advance(newest[0] + int(
+                        (wall_time() - newest[1]) * 1000000))
+                interval.output(len(tracker.requests))
+                sleep(ctx.follow)
+        except KeyboardInterrupt:
+            sinks.remove(interval.add)
+    elif ctx.jobs > 1:
+        tracker = Tracker(sink)
+        for osd, names, partial in parallel_tracker_events(
+                logs['osd'], ctx.jobs, ctx.cache_dir, offsets):
+            tracker.add_partial(osd, names, partial)
+    elif ctx.clients:
+        tracker = Tracker(sink, ctx.idle, ctx.grace)
+        for kind, parsed in merged_log_events(logs['osd'], logs['client'],
+                                              cache, offsets):
+            if kind == 'osd':
+                tracker.add_event(parsed)
+            else:
+                correlator.add_client(parsed)
+    else:
+        if ctx.stream:
+            tracker = Tracker(sink, ctx.idle, ctx.grace)
+            events = merged_tracker_events(logs['osd'], cache, offsets)
+        else:
+            tracker = Tracker(sink)
+            events = serial_tracker_events(logs['osd'], cache, offsets)
+        for parsed in events:
+            tracker.add_event(parsed)
+    tracker.flush()
+    report.output()
+    if ctx.phases:
+        phases.output()
+    if ctx.clients:
+        correlator.flush()
+        correlator.output()
+    if ctx.export:
+        columns.save(ctx.export)
+    if ctx.series:
+        series.save(ctx.series)
+
+if __name__ == '__main__':
+    main()
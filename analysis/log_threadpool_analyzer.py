@@ -1,30 +1,67 @@
 #!/usr/bin/python
 
-# This program is used to parse ceph osd log files with threadpool debugging 
+# This program is used to parse ceph osd log files with threadpool debugging
 # set at 15 or higher. These can be generated with ceph-osd or
 # test_filestore_workloadgen.
 #
+# Every threadpool in the log (FileStore::op_tp, OSD::op_tp, OSD::disk_tp,
+# ...) is found from its 'worker' lines, and the journal write thread from
+# its write_thread_entry lines (debug journal = 20), in the same pass.  Each
+# gets its own per-second table, and a run summary follows with busy and
+# wait time, op counts and op times per pool and per thread.
+#
+# Op times are kept in log-linear histograms (loghist.py): one for the whole
+# run per thread and per work queue, and one per work queue for each second
+# that is still being logged.  A second's percentiles are kept once it is
+# over and its histogram dropped, so the per-second op time table costs a
+# few numbers per second like the utilization table.
+#
+# Times are integer microseconds.  Each finished op and wait is swept into
+# per-second arrays as soon as its end is read, split across the second
+# boundaries it crosses by arithmetic, so the log is read once.  A start is
+# held only until its done arrives, so the memory kept is one slot per
+# second of log per work queue plus the work in flight.
+#
+# With debug filestore = 10, the FileStore op queue is followed too: per
+# second, the ops queued and dequeued, the average queue depth and number
+# of ops in service, and queueing delay percentiles, and for the run the
+# arrival rate (lambda), mean depth (L) and mean delay (W) of Little's law,
+# L = lambda * W, which with the mean service time show how many
+# filestore_op_threads the load keeps busy.
+#
+# With --jobs, a plain log of more than logio.MIN_RANGE bytes is split into
+# newline-aligned byte ranges swept by worker processes.  Work and waits
+# that cross a range boundary are stitched together when the ranges are
+# merged, in log order, so the report is the same as from one sweep.
+#
 # Usage:
 #
-# log_threadpool_analyzer.py OUT_FILE
+# log_threadpool_analyzer.py [--jobs N] OUT_FILE
 
+import argparse
+import multiprocessing
 import os
-import os.path
-import re
-import sys
-import decimal
-import datetime
-from datetime import datetime,timedelta
-
-threads = {}
-waits = {}
-wc = 0
-waitstate = False
-sdate = ""
-edate = ""
-
-df = "%Y-%m-%d %H:%M:%S.%f"
-dsf = "%Y-%m-%d %H:%M:%S"
+from array import array
+
+import loghist
+import logio
+
+SECOND = 1000000
+
+# Percentiles of op time reported per second and in the run summary.
+PERCENTILES = [50, 95, 99]
+
+# The journal write thread is reported as a pool of its own with one work
+# queue, busy from 'woke up' until 'going to sleep'.
+JOURNAL = 'journal'
+JOURNAL_WQ = 'write_thread'
+
+# FileStore op queue lines, and the OpQueue method for each.
+OP_QUEUE = {
+    'queue_op': 'queue_op',
+    '_do_op': 'do_op',
+    '_finish_op': 'finish_op',
+    }
 
 def fcell(item, width):
     if isinstance(item, str):
@@ -34,139 +71,780 @@ def fcell(item, width):
     if isinstance(item, float):
        return ("%.2f" % item).rjust(width)[:width]
 
-filename = sys.argv[1]
-f = open(filename, 'rb')
-for line in f:
-    words = line.split()
-    date = "%s %s" % (words[0], words[1])
-
-    edate = date
-    if sdate == "":
-       sdate = date
- 
-    if words[4] == 'FileStore::op_tp' and words[5] == 'worker':
-        # Handle wait periods
-        if waitstate == True:
-            waits[wc]['done'] = date
-            waitstate = False
-            wc += 1
-        if words[6] == 'waiting':
-            waits[wc] = {}
-            waits[wc]['start'] = date
-            waitstate = True
-        elif words[6] == "wq":
-            blah,thread = words[7].split('::', 1)
-            if thread not in threads:
-                threads[thread] = {}
-            action = words[8]
-            item = words[10]
-
-            if item not in threads[thread]:
-                threads[thread][item] = {}
-            length = len(threads[thread][item])
-            if action == 'start':
-                length += 1;
-                threads[thread][item][length] = {}
-            
-            threads[thread][item][length][action] = date
-
-seconds = {}
-for wait in waits:
-    if 'start' not in waits[wait] or 'done' not in waits[wait]:
-        continue
-    start = datetime.strptime(waits[wait]['start'], df)
-    done = datetime.strptime(waits[wait]['done'], df)
-
-    while (done - start).total_seconds() > 0:
-        second = start.strftime(dsf)
-        nt = start.replace(microsecond=0) + timedelta(seconds=1)
-        if (nt > done):
-            nt = done
-        delta = nt - start
-        
-        if second not in seconds:
-            seconds[second] = {}
-        if 'wait' in seconds[second]:
-            seconds[second]['wait'] += delta.total_seconds()
+def line_time(words):
+    return logio.log_time("%s %s" % (words[0], words[1]))
+
+def log_span(filename):
+    # Times of the first and last lines, to size the per-second arrays up
+    # front; None where a line has no time stamp.
+    with open(filename, 'rb') as f:
+        head = f.readline()
+        f.seek(max(0, os.fstat(f.fileno()).st_size - 65536))
+        tail = f.read().rstrip('\n').rsplit('\n', 1)[-1]
+    span = []
+    for line in [head, tail]:
+        try:
+            span.append(line_time(line.split(None, 2)))
+        except (IndexError, ValueError):
+            span.append(None)
+    return span
+
+class Utilization(object):
+    # Busy microseconds and finished ops per second, indexed by seconds
+    # since base.  A line logged late can carry a time before base, the
+    # second of the first line; that time counts as the start of base, as
+    # an array index below 0 would count in the last seconds instead.
+    def __init__(self, base, seconds):
+        self.base = base
+        self.busy = array('l', [0]) * seconds
+        self.ops = array('l', [0]) * seconds
+
+    def grow(self, index):
+        more = index + 1 - len(self.busy)
+        if more > 0:
+            self.busy.extend(array('l', [0]) * more)
+            self.ops.extend(array('l', [0]) * more)
+
+    def add(self, start, done):
+        # As before, an op only counts in the second it finishes in, and
+        # not at all if it finishes exactly on a second boundary.
+        start = max(start, self.base * SECOND)
+        if done <= start:
+            return
+        first = start // SECOND
+        last = (done - 1) // SECOND
+        self.grow(last - self.base)
+        busy = self.busy
+        if first == last:
+            busy[first - self.base] += done - start
         else:
-            seconds[second]['wait'] = delta.total_seconds()
-        start = nt
+            busy[first - self.base] += (first + 1) * SECOND - start
+            for second in xrange(first + 1 - self.base, last - self.base):
+                busy[second] += SECOND
+            busy[last - self.base] += done - last * SECOND
+        if done % SECOND:
+            self.ops[last - self.base] += 1
+
+    def merge(self, other):
+        self.grow(len(other.busy) - 1)
+        for index, busy in enumerate(other.busy):
+            self.busy[index] += busy
+        for index, ops in enumerate(other.ops):
+            self.ops[index] += ops
+
+    def busy_seconds(self, offset):
+        if offset < len(self.busy):
+            return self.busy[offset] / float(SECOND)
+        return 0.0
+
+    def op_count(self, offset):
+        if offset < len(self.ops):
+            return self.ops[offset]
+        return 0
+
+class OpTimes(object):
+    # Op time percentiles per second and for the whole run.  latest is the
+    # last second any 'done' of the work queue has been seen in, and an op
+    # finishing more than SLACK seconds before it (a thread logging very
+    # late) only counts in the run.  Histograms of earlier seconds can get
+    # no more ops, so they are closed: their percentiles go into per-second
+    # arrays and the histogram is dropped.  Those of a chunk of the log
+    # (keep) are all kept to be merged.
+    SLACK = 2
+
+    def __init__(self, base, seconds, keep=False):
+        self.base = base
+        self.keep = keep
+        self.counts = array('l', [0]) * seconds
+        self.columns = [array('l', [0]) * seconds
+                        for _ in PERCENTILES + ['max']]
+        self.open = {}
+        self.latest = None
+        self.run = loghist.LogHistogram()
+
+    def seen(self, done):
+        second = (done - 1) // SECOND
+        if self.latest is None or second > self.latest:
+            self.latest = second
+            if not self.keep:
+                self.close_before(second - self.SLACK)
+
+    def add(self, done, latency, latest=None):
+        # latest is the value self.latest had when the op finished, where
+        # that was in another chunk of the log.
+        if latest is None:
+            latest = self.latest
+        self.run.add(latency)
+        # Ops finished before base count in base, as in Utilization.
+        second = max((done - 1) // SECOND, self.base)
+        if second < latest - self.SLACK:
+            return
+        hist = self.open.get(second)
+        if hist is None:
+            hist = loghist.LogHistogram()
+            self.open[second] = hist
+        hist.add(latency)
 
-for thread in threads:
-    for item in threads[thread]:
-        for instance in threads[thread][item]:
-            if 'start' not in threads[thread][item][instance] or 'done' not in threads[thread][item][instance]:
+    def merge(self, other):
+        # Ops of the following chunk of the log.  A second the chunk had
+        # open that is too late here would have been closed by the time
+        # the chunk's ops in it were read.
+        self.run.merge(other.run)
+        for second, hist in other.open.iteritems():
+            if self.latest is not None and second < self.latest - self.SLACK:
                 continue
+            mine = self.open.get(second)
+            if mine is None:
+                self.open[second] = hist
+            else:
+                mine.merge(hist)
+        if other.latest is not None and (self.latest is None or
+                                         other.latest > self.latest):
+            self.latest = other.latest
 
-            start = datetime.strptime(threads[thread][item][instance]['start'], df)
-            done = datetime.strptime(threads[thread][item][instance]['done'], df)
-
-            while (done - start).total_seconds() > 0: 
-                second = start.strftime(dsf)
-
-                if second not in seconds:
-                    seconds[second] = {}
-                if 'threads' not in seconds[second]:
-                    seconds[second]['threads'] = {}
-                if thread not in seconds[second]['threads']:
-                    seconds[second]['threads'][thread] = {}
-                    
-                nt = start.replace(microsecond=0) + timedelta(seconds=1)
-                if (nt > done):
-                    nt = done
-                    if 'count' not in seconds[second]['threads'][thread]:
-                        seconds[second]['threads'][thread]['count'] = 1
-                    else:
-                        seconds[second]['threads'][thread]['count'] += 1
-
-                delta = nt - start
-
-                if 'time' not in seconds[second]['threads'][thread]:
-                    seconds[second]['threads'][thread]['time'] = delta.total_seconds()
-                else:
-                    seconds[second]['threads'][thread]['time'] += delta.total_seconds()
-
-                start = nt
-
-
-d = datetime.strptime(sdate, df).replace(microsecond=0)
-ed = datetime.strptime(edate, df).replace(microsecond=0)
-print fcell(" " * 19, 19), fcell("Waiting", 10),
-for thread in sorted(threads):
-    print fcell(thread, 10),
-    print fcell(thread, 10),
-    print fcell(thread, 10),
-print ""
-print fcell("TiemStamp", 19), fcell("% Time", 10),
-for thread in sorted(threads):
-    print fcell("% Time", 10),
-    print fcell("Op Count", 10),
-    print fcell("Avg Op Tm", 10),
-print ""
-print fcell("-" * 19, 19), fcell("-" * 10, 10),
-for thread in sorted(threads):
-    print fcell("-" * 10, 10),
-    print fcell("-" * 10, 10),
-    print fcell("-" * 10, 10),
-print ""
-
-while d <= ed:
-    second = d.strftime(dsf)
-    sdict = seconds.get(second, {})
-    print fcell(second,19),
-    wait = "%.2f%%" % float(sdict.get('wait', 0) * 100)
-    print fcell(wait, 10),
+    def close_before(self, second):
+        for old in [s for s in self.open if s < second]:
+            self.close(old)
+
+    def close(self, second):
+        hist = self.open.pop(second)
+        index = second - self.base
+        more = index + 1 - len(self.counts)
+        if more > 0:
+            for column in [self.counts] + self.columns:
+                column.extend(array('l', [0]) * more)
+        self.counts[index] = hist.count
+        values = hist.percentiles(PERCENTILES) + [hist.max]
+        for column, value in zip(self.columns, values):
+            column[index] = value
+
+    def finish(self):
+        for second in list(self.open):
+            self.close(second)
+
+    def percentiles(self, offset):
+        # [p50, ..., max] in microseconds, or None if no op finished then.
+        if offset >= len(self.counts) or not self.counts[offset]:
+            return None
+        return [column[offset] for column in self.columns]
+
+class ThreadStats(object):
+    # Run totals of one worker thread, in microseconds.
+    __slots__ = ('busy', 'ops', 'wait', 'waiting', 'latency')
+
+    def __init__(self):
+        self.busy = 0
+        self.ops = 0
+        self.wait = 0
+        self.waiting = None
+        self.latency = loghist.LogHistogram()
+
+class Pool(object):
+    # One threadpool: a Utilization per work queue for the per-second table
+    # and totals per worker thread.  The table's Waiting column keeps the
+    # original accounting, where a wait lasts until the next line of any of
+    # the pool's threads; a thread's own wait lasts until its own next line.
+    #
+    # The pool of a chunk of the log (chunk) also keeps what merge() needs
+    # to carry work and waits over from the chunks before it.
+    def __init__(self, name, base, seconds, chunk=False):
+        self.name = name
+        self.base = base
+        self.seconds = seconds
+        self.chunk = chunk
+        self.waits = Utilization(base, seconds)
+        self.waiting = None
+        self.wqs = {}
+        self.times = {}
+        self.threads = {}
+        # thread -> (work queue, item, start) of the work it has in flight.
+        # A worker logs the start and the done of an item itself, and works
+        # on one item at a time, so a start replaces any unfinished one and
+        # a done finishes the thread's item if it is the same; a second
+        # 'done' for the same start finds nothing and is ignored.
+        self.instances = {}
+        # For chunks: the time of the first line, the time of each thread's
+        # first line, the threads that started or finished work, and the
+        # dones of those that finished work before starting any, with
+        # times.latest as it was then.
+        self.first = None
+        self.heads = {}
+        self.paired = set()
+        self.orphans = []
+
+    def thread(self, tid):
+        stats = self.threads.get(tid)
+        if stats is None:
+            stats = ThreadStats()
+            self.threads[tid] = stats
+        return stats
+
+    def wq(self, name):
+        util = self.wqs.get(name)
+        if util is None:
+            util = Utilization(self.base, self.seconds)
+            self.wqs[name] = util
+            self.times[name] = OpTimes(self.base, self.seconds, self.chunk)
+        return util
+
+    def line(self, tid, date):
+        # Any line of the pool ends the waits it was in.
+        if self.chunk:
+            if self.first is None:
+                self.first = date
+            self.heads.setdefault(tid, date)
+        if self.waiting is not None:
+            self.waits.add(self.waiting, date)
+            self.waiting = None
+        stats = self.thread(tid)
+        if stats.waiting is not None:
+            stats.wait += date - stats.waiting
+            stats.waiting = None
+        return stats
+
+    def wait(self, tid, date):
+        self.line(tid, date).waiting = date
+        self.waiting = date
+
+    def action(self, tid, wq, action, item, date):
+        self.line(tid, date)
+        self.wq(wq)
+        if action == 'start':
+            if self.chunk:
+                self.paired.add(tid)
+            self.instances[tid] = (wq, item, date)
+        elif action == 'done':
+            times = self.times[wq]
+            times.seen(date)
+            if self.chunk and tid not in self.paired:
+                self.paired.add(tid)
+                self.orphans.append((tid, wq, item, date, times.latest))
+                return
+            instance = self.instances.pop(tid, None)
+            if instance is not None and instance[:2] == (wq, item):
+                self.finish(tid, wq, instance[2], date)
+
+    def finish(self, tid, wq, start, done, latest=None):
+        self.wqs[wq].add(start, done)
+        stats = self.thread(tid)
+        stats.busy += done - start
+        stats.ops += 1
+        stats.latency.add(done - start)
+        self.times[wq].add(done, done - start, latest)
+
+    def merge(self, chunk):
+        # Add the pool of the following chunk of the log, as if its lines
+        # had been read here.
+        if self.waiting is not None:
+            self.waits.add(self.waiting, chunk.first)
+        self.waiting = chunk.waiting
+        self.waits.merge(chunk.waits)
+        for tid, other in chunk.threads.iteritems():
+            stats = self.thread(tid)
+            if stats.waiting is not None:
+                stats.wait += chunk.heads[tid] - stats.waiting
+            stats.waiting = other.waiting
+            stats.busy += other.busy
+            stats.ops += other.ops
+            stats.wait += other.wait
+            stats.latency.merge(other.latency)
+        latest = dict((wq, times.latest)
+                      for wq, times in self.times.iteritems())
+        for wq in chunk.wqs:
+            self.wq(wq).merge(chunk.wqs[wq])
+            self.times[wq].merge(chunk.times[wq])
+        for tid, wq, item, done, seen in chunk.orphans:
+            instance = self.instances.pop(tid, None)
+            if instance is not None and instance[:2] == (wq, item):
+                before = latest.get(wq)
+                if before is not None:
+                    seen = max(before, seen)
+                self.finish(tid, wq, instance[2], done, seen)
+        for tid in chunk.paired:
+            self.instances.pop(tid, None)
+        self.instances.update(chunk.instances)
+        for times in self.times.itervalues():
+            if times.latest is not None:
+                times.close_before(times.latest - OpTimes.SLACK)
+
+class OpQueue(object):
+    # The FileStore op queue, from the queue_op, _do_op and _finish_op lines
+    # of FileStore (debug filestore = 10), matched by op seq.  An op waits
+    # in the queue from queue_op to _do_op and is in service from _do_op to
+    # _finish_op.  Per second: the ops queued and dequeued (at the time of
+    # the line, an op on a second boundary counting in the second before,
+    # as for op times), the summed queueing delay of the ops dequeued, and
+    # the integrals of queue length and of ops in service, which are the
+    # average queue depth and the average number of op_tp threads busy.
+    # Ops still queued or in service at the end are not counted.
+    #
+    # A chunk of the log keeps the _do_op and _finish_op lines of ops it
+    # has no queue_op or _do_op for as orphans, for merge().
+    def __init__(self, base, seconds, chunk=False):
+        self.base = base
+        self.chunk = chunk
+        self.depth = Utilization(base, seconds)
+        self.service = Utilization(base, seconds)
+        self.arrivals = array('l', [0]) * seconds
+        self.dequeues = array('l', [0]) * seconds
+        self.wait = array('l', [0]) * seconds
+        self.delays = OpTimes(base, seconds, chunk)
+        self.service_time = 0
+        self.finished = 0
+        # seq -> time of its queue_op or _do_op.
+        self.queued = {}
+        self.running = {}
+        self.orphans = []
+
+    def count(self, column, date, value=1):
+        index = max((date - 1) // SECOND - self.base, 0)
+        self.grow(index)
+        column[index] += value
+
+    def grow(self, index):
+        more = index + 1 - len(self.arrivals)
+        if more > 0:
+            for column in [self.arrivals, self.dequeues, self.wait]:
+                column.extend(array('l', [0]) * more)
+
+    def queue_op(self, seq, date):
+        self.count(self.arrivals, date)
+        self.queued[seq] = date
+
+    def do_op(self, seq, date):
+        self.delays.seen(date)
+        self.running[seq] = date
+        queued = self.queued.pop(seq, None)
+        if queued is not None:
+            self.dequeued(queued, date)
+        elif self.chunk:
+            self.orphans.append(('_do_op', seq, date, self.delays.latest))
+
+    def dequeued(self, queued, date, latest=None):
+        self.depth.add(queued, date)
+        self.count(self.dequeues, date)
+        self.count(self.wait, date, date - queued)
+        self.delays.add(date, date - queued, latest)
+
+    def finish_op(self, seq, date):
+        start = self.running.pop(seq, None)
+        if start is not None:
+            self.done(start, date)
+        elif self.chunk:
+            self.orphans.append(('_finish_op', seq, date, None))
+
+    def done(self, start, date):
+        self.service.add(start, date)
+        self.service_time += date - start
+        self.finished += 1
+
+    def merge(self, chunk):
+        # Add the queue of the following chunk of the log, as if its lines
+        # had been read here.  This relies on seqs not repeating in a log,
+        # as FileStore numbers ops on from the last committed seq when it
+        # mounts.
+        self.depth.merge(chunk.depth)
+        self.service.merge(chunk.service)
+        self.grow(len(chunk.arrivals) - 1)
+        for mine, other in [(self.arrivals, chunk.arrivals),
+                            (self.dequeues, chunk.dequeues),
+                            (self.wait, chunk.wait)]:
+            for index, value in enumerate(other):
+                mine[index] += value
+        self.service_time += chunk.service_time
+        self.finished += chunk.finished
+        latest = self.delays.latest
+        self.delays.merge(chunk.delays)
+        for line, seq, date, seen in chunk.orphans:
+            if line == '_do_op':
+                queued = self.queued.pop(seq, None)
+                if queued is not None:
+                    if latest is not None:
+                        seen = max(latest, seen)
+                    self.dequeued(queued, date, seen)
+            else:
+                start = self.running.pop(seq, None)
+                if start is not None:
+                    self.done(start, date)
+        self.queued.update(chunk.queued)
+        self.running.update(chunk.running)
+        if self.delays.latest is not None:
+            self.delays.close_before(self.delays.latest - OpTimes.SLACK)
+
+def sweep_lines(lines, sdate, seconds, chunk=False):
+    # Returns (first and last line times, {pool name: Pool}, OpQueue or
+    # None, last line).  With sdate given, lines is a chunk of a log
+    # starting at sdate.
+    edate = None
+    pools = {}
+    queue = None
+    tail = None
+    for line in lines:
+        # Only the time of the first and the last line of the rest of the
+        # log is needed.
+        tail = line
+        if sdate is not None and ' worker ' not in line and \
+           'write_thread_entry' not in line and '_op 0x' not in line:
+            continue
+        words = line.split(None, 11)
+        try:
+            date = line_time(words)
+        except (IndexError, ValueError):
+            continue
+        edate = date
+        if sdate is None:
+            sdate = date
+        if len(words) < 7:
+            continue
+        if words[4].startswith('filestore(') and words[5] in OP_QUEUE:
+            if len(words) < 9 or words[7] != 'seq':
+                continue
+            if queue is None:
+                queue = OpQueue(sdate // SECOND, seconds, chunk)
+            getattr(queue, OP_QUEUE[words[5]])(words[8], date)
+            continue
+        if words[5] == 'worker':
+            name = words[4]
+        elif words[4] == 'journal' and words[5] == 'write_thread_entry':
+            name = JOURNAL
+        else:
+            continue
+        pool = pools.get(name)
+        if pool is None:
+            pool = Pool(name, sdate // SECOND, seconds, chunk)
+            pools[name] = pool
+        tid = words[2]
+        if name == JOURNAL:
+            if words[6] == 'going':
+                pool.action(tid, JOURNAL_WQ, 'done', tid, date)
+                pool.wait(tid, date)
+            elif words[6] == 'woke':
+                pool.action(tid, JOURNAL_WQ, 'start', tid, date)
+            else:
+                pool.line(tid, date)
+        elif words[6] == 'waiting':
+            pool.wait(tid, date)
+        elif words[6] == 'wq':
+            try:
+                wq = words[7].split('::', 1)[1]
+                action = words[8]
+                item = words[10]
+            except IndexError:
+                pool.line(tid, date)
+                continue
+            pool.action(tid, wq, action, item, date)
+        else:
+            pool.line(tid, date)
+    return (sdate, edate, pools, queue, tail)
+
+def sweep_range(job):
+    # Worker for sweep(): the pools of one byte range of the log.
+    filename, sdate, seconds, start, end = job
+    with logio.MappedLog(filename, None, start, end) as lines:
+        _, edate, pools, queue, _ = sweep_lines(lines, sdate, seconds,
+                                                True)
+    return (edate, pools, queue)
+
+def first_time(filename):
+    # The time of the first line that has one, as sweep_lines() finds it.
+    with open(filename, 'rb') as f:
+        for line in f:
+            try:
+                return line_time(line.split(None, 2))
+            except (IndexError, ValueError):
+                pass
+    return None
+
+def last_line(filename):
+    # The last line of the log, as iterating over it would return it.
+    with open(filename, 'rb') as f:
+        f.seek(max(0, os.fstat(f.fileno()).st_size - 65536))
+        block = f.read()
+    if block.endswith('\n'):
+        return block[:-1].rsplit('\n', 1)[-1] + '\n'
+    return block.rsplit('\n', 1)[-1] or None
+
+def sweep(filename, jobs=1):
+    # Returns (first and last line times, {pool name: Pool}, OpQueue or
+    # None).  With jobs,
+    # a large log is split into ranges of lines swept by worker processes,
+    # and the pools of each range are merged into those of the ranges
+    # before it in log order, which gives the same pools as one sweep.
+    first, last = log_span(filename)
+    seconds = 1
+    if first is not None and last is not None and last >= first:
+        seconds = last // SECOND - first // SECOND + 1
+    ranges = logio.line_ranges(filename, jobs)
+    if len(ranges) == 1:
+        with open(filename, 'rb') as f:
+            sdate, edate, pools, queue, tail = sweep_lines(f, None,
+                                                           seconds)
+    else:
+        sdate = first_time(filename)
+        edate = sdate
+        pools = {}
+        queue = None
+        tail = last_line(filename)
+        parts = [(filename, sdate, seconds, start, end)
+                 for start, end in ranges]
+        workers = multiprocessing.Pool(jobs)
+        try:
+            for chunk_edate, chunk_pools, chunk_queue in workers.imap(
+                    sweep_range, parts):
+                if chunk_edate is not None:
+                    edate = chunk_edate
+                for name, chunk in chunk_pools.iteritems():
+                    pool = pools.get(name)
+                    if pool is None:
+                        pool = Pool(name, sdate // SECOND, seconds)
+                        pools[name] = pool
+                    pool.merge(chunk)
+                if chunk_queue is not None:
+                    if queue is None:
+                        queue = OpQueue(sdate // SECOND, seconds)
+                    queue.merge(chunk_queue)
+        finally:
+            workers.close()
+            workers.join()
+    try:
+        edate = max(edate, line_time(tail.split(None, 2)))
+    except (AttributeError, IndexError, ValueError, TypeError):
+        pass
+    for pool in pools.itervalues():
+        for times in pool.times.itervalues():
+            times.finish()
+    if queue is not None:
+        queue.delays.finish()
+    return (sdate, edate, pools, queue)
+
+def output_pool(sdate, edate, pool):
+    waits = pool.waits
+    threads = pool.wqs
+    print "Threadpool %s" % pool.name
+    print fcell(" " * 19, 19), fcell("Waiting", 10),
+    for thread in sorted(threads):
+        print fcell(thread, 10),
+        print fcell(thread, 10),
+        print fcell(thread, 10),
+    print ""
+    print fcell("TiemStamp", 19), fcell("% Time", 10),
     for thread in sorted(threads):
-        trdict = sdict.get('threads', {})
-        tdict = trdict.get(thread, {})
-        util = float(tdict.get('time', 0))
-        count = tdict.get('count', 0)
-        print fcell("%.2f%%" % float(util * 100), 10),
-        print fcell(count, 10),
-        avgoptime = "N/A"
-        if count > 0:
-            avgoptime = 1000 * util / count
-        print fcell(avgoptime, 10), 
+        print fcell("% Time", 10),
+        print fcell("Op Count", 10),
+        print fcell("Avg Op Tm", 10),
+    print ""
+    print fcell("-" * 19, 19), fcell("-" * 10, 10),
+    for thread in sorted(threads):
+        print fcell("-" * 10, 10),
+        print fcell("-" * 10, 10),
+        print fcell("-" * 10, 10),
+    print ""
+
+    for offset in xrange(edate // SECOND - sdate // SECOND + 1):
+        second = logio.format_time((sdate // SECOND + offset) * SECOND,
+                                   "%Y-%m-%d %H:%M:%S")
+        print fcell(second,19),
+        wait = "%.2f%%" % float(waits.busy_seconds(offset) * 100)
+        print fcell(wait, 10),
+        for thread in sorted(threads):
+            util = threads[thread].busy_seconds(offset)
+            count = threads[thread].op_count(offset)
+            print fcell("%.2f%%" % float(util * 100), 10),
+            print fcell(count, 10),
+            avgoptime = "N/A"
+            if count > 0:
+                avgoptime = 1000 * util / count
+            print fcell(avgoptime, 10),
+        print ""
+    print ""
+
+    times = pool.times
+    labels = ["p%d ms" % p for p in PERCENTILES] + ["max ms"]
+    print fcell(" " * 19, 19),
+    for wq in sorted(times):
+        for label in labels:
+            print fcell(wq, 10),
+    print ""
+    print fcell("TimeStamp", 19),
+    for wq in sorted(times):
+        for label in labels:
+            print fcell(label, 10),
+    print ""
+    print fcell("-" * 19, 19),
+    for wq in sorted(times):
+        for label in labels:
+            print fcell("-" * 10, 10),
+    print ""
+
+    for offset in xrange(edate // SECOND - sdate // SECOND + 1):
+        second = logio.format_time((sdate // SECOND + offset) * SECOND,
+                                   "%Y-%m-%d %H:%M:%S")
+        print fcell(second, 19),
+        for wq in sorted(times):
+            values = times[wq].percentiles(offset)
+            for value in values or [None] * len(labels):
+                if value is None:
+                    print fcell("N/A", 10),
+                else:
+                    print fcell(value / 1000.0, 10),
+        print ""
+    print ""
+
+def output_summary(sdate, edate, pools):
+    # Busy and wait time as a share of the run, for each thread and averaged
+    # over each pool's threads; op times in milliseconds.  Work queue rows
+    # have no wait time of their own.
+    span = float(max(edate - sdate, 1))
+    rows = []
+    for name in sorted(pools):
+        pool = pools[name]
+        threads = pool.threads
+        total = ThreadStats()
+        for stats in threads.itervalues():
+            total.busy += stats.busy
+            total.ops += stats.ops
+            total.wait += stats.wait
+            total.latency.merge(stats.latency)
+        count = max(len(threads), 1)
+        rows.append((name, 'all', total.busy, total.wait, total.ops,
+                     total.latency, count))
+        for tid in sorted(threads):
+            stats = threads[tid]
+            rows.append((name, tid, stats.busy, stats.wait, stats.ops,
+                         stats.latency, 1))
+        for wq in sorted(pool.wqs):
+            run = pool.times[wq].run
+            rows.append((name, 'wq ' + wq, sum(pool.wqs[wq].busy), None,
+                         run.count, run, count))
+    width = max([len(name) for name in pools] + [4])
+    print "Run summary"
+    print "%-*s %-16s %8s %8s %10s %9s" % (
+        width, "pool", "thread", "busy%", "wait%", "ops", "avg ms") + \
+        "".join("%9s" % ("p%d ms" % p) for p in PERCENTILES) + \
+        "%9s" % "max ms"
+    for name, label, busy, wait, ops, latency, threads in rows:
+        if wait is None:
+            wait = "%8s" % "-"
+        else:
+            wait = "%7.2f%%" % (100 * wait / span / threads)
+        print "%-*s %-16s %7.2f%% %s %10d %9.3f" % (
+            width, name, label, 100 * busy / span / threads, wait, ops,
+            latency.mean() / 1000) + \
+            "".join("%9.3f" % (value / 1000.0)
+                    for value in latency.percentiles(PERCENTILES)) + \
+            "%9.3f" % ((latency.max or 0) / 1000.0)
+
+def output_queue(sdate, edate, queue):
+    # Per second: ops queued and dequeued, average queue depth (L), delay
+    # of the ops dequeued (W), average ops in service and the throughput
+    # Little's law gives for the queue, L / W.
+    labels = ["Queued", "Dequeued", "Avg Depth", "Avg Wait"] + \
+        ["p%d Wait" % p for p in PERCENTILES] + \
+        ["max Wait", "In Service", "L/W ops/s"]
+    print "FileStore op queue (times in ms)"
+    print fcell("TimeStamp", 19),
+    for label in labels:
+        print fcell(label, 10),
     print ""
+    print fcell("-" * 19, 19),
+    for label in labels:
+        print fcell("-" * 10, 10),
+    print ""
+
+    for offset in xrange(edate // SECOND - sdate // SECOND + 1):
+        second = logio.format_time((sdate // SECOND + offset) * SECOND,
+                                   "%Y-%m-%d %H:%M:%S")
+        print fcell(second, 19),
+        depth = queue.depth.busy_seconds(offset)
+        queued = dequeued = wait = 0
+        if offset < len(queue.arrivals):
+            queued = queue.arrivals[offset]
+            dequeued = queue.dequeues[offset]
+            wait = queue.wait[offset]
+        print fcell(queued, 10),
+        print fcell(dequeued, 10),
+        print fcell(depth, 10),
+        delays = queue.delays.percentiles(offset)
+        if dequeued:
+            print fcell(wait / 1000.0 / dequeued, 10),
+        else:
+            print fcell("N/A", 10),
+        for value in delays or [None] * (len(PERCENTILES) + 1):
+            if value is None:
+                print fcell("N/A", 10),
+            else:
+                print fcell(value / 1000.0, 10),
+        print fcell(queue.service.busy_seconds(offset), 10),
+        if wait:
+            print fcell(depth * SECOND * dequeued / float(wait), 10),
+        else:
+            print fcell("N/A", 10),
+        print ""
+    print ""
+
+def output_queue_summary(sdate, edate, pools, queue):
+    # Little's law, L = lambda * W, over the run: the arrival rate and the
+    # mean queueing delay against the mean queue depth measured, and the
+    # ops in service (lambda * S) against the op_tp threads there are.
+    span = max(edate - sdate, 1) / float(SECOND)
+    arrivals = sum(queue.arrivals)
+    dequeues = sum(queue.dequeues)
+    rate = arrivals / span
+    depth = sum(queue.depth.busy) / float(SECOND) / span
+    wait = sum(queue.wait) / float(max(dequeues, 1)) / SECOND
+    service = queue.service_time / float(max(queue.finished, 1)) / SECOND
+    delays = queue.delays.run
+    pool = pools.get('FileStore::op_tp')
+    print "FileStore op queue summary"
+    print "%-26s %10d queued, %d dequeued, %d finished" % (
+        "ops", arrivals, dequeues, queue.finished)
+    print "%-26s %10.1f ops/s" % ("arrival rate (lambda)", rate)
+    print "%-26s %10.3f" % ("mean queue depth (L)", depth)
+    print "%-26s %10.3f ms" % ("mean queueing delay (W)", wait * 1000) + \
+        "".join("  p%d %.3f" % (p, value / 1000.0) for p, value in
+                zip(PERCENTILES, delays.percentiles(PERCENTILES))) + \
+        "  max %.3f" % ((delays.max or 0) / 1000.0)
+    print "%-26s %10.3f" % ("lambda * W", rate * wait)
+    if wait:
+        print "%-26s %10.1f ops/s" % ("throughput (L / W)", depth / wait)
+    print "%-26s %10.3f ms" % ("mean service time (S)", service * 1000)
+    print "%-26s %10.3f" % ("ops in service",
+                            sum(queue.service.busy) / float(SECOND) / span),
+    if pool is not None:
+        print "of %d op_tp threads" % len(pool.threads),
+    print ""
+
+def output(sdate, edate, pools, queue):
+    if sdate is None:
+        return
+    for name in sorted(pools):
+        output_pool(sdate, edate, pools[name])
+    if queue is not None:
+        output_queue(sdate, edate, queue)
+    output_summary(sdate, edate, pools)
+    if queue is not None:
+        print ""
+        output_queue_summary(sdate, edate, pools, queue)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Report threadpool utilization from a ceph osd log.')
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='Split a large log between this many worker processes.',
+        )
+    parser.add_argument(
+        'filename',
+        metavar='OUT_FILE',
+        help='osd log with threadpool debugging at 15 or higher.',
+        )
+    return parser.parse_args()
+
+def main():
+    ctx = parse_args()
+    output(*sweep(ctx.filename, ctx.jobs))
 
-    d += timedelta(seconds=1)
+if __name__ == '__main__':
+    main()
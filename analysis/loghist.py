@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+# Log-linear histogram for latencies and other non-negative integers.
+#
+# Values below 2 ** (SUB_BITS + 1) get a bucket each; above that every power
+# of two is split into 2 ** SUB_BITS equal buckets, so a bucket is never
+# wider than about 1 / 2 ** SUB_BITS of its value (3% with the default).
+# Only non-empty buckets are stored, and two histograms with the same
+# SUB_BITS merge by adding counts, so per-worker or per-interval histograms
+# can be combined without keeping the samples.
+#
+# LogHistogram clamps negative values to 0.  SignedHistogram keeps values
+# that can be negative, such as one-way times between hosts whose clock
+# offset is only estimated, as two LogHistograms of magnitudes.
+
+SUB_BITS = 5
+
+def bucket_index(value):
+    if value < 2 << SUB_BITS:
+        return value
+    shift = value.bit_length() - 1 - SUB_BITS
+    return (shift << SUB_BITS) + (value >> shift)
+
+def bucket_bounds(index):
+    # Smallest and largest value that fall into bucket index.
+    if index < 2 << SUB_BITS:
+        return (index, index)
+    shift = (index >> SUB_BITS) - 1
+    mantissa = index - (shift << SUB_BITS)
+    return (mantissa << shift, ((mantissa + 1) << shift) - 1)
+
+def percentile_rank(pct, count):
+    return max(1, int(-(-pct * count // 100)))
+
+class LogHistogram(object):
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            value = 0
+        index = bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or
+                                      other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or
+                                      other.max > self.max):
+            self.max = other.max
+        return self
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return float(self.total) / self.count
+
+    def percentile(self, pct):
+        # Upper bound of the bucket holding the pct'th percentile, clamped
+        # to the observed range so p0 and p100 are exact.
+        if not self.count:
+            return 0
+        return self.ranked(percentile_rank(pct, self.count))
+
+    def ranked(self, rank):
+        # The same for the rank'th smallest value, counting from 1.
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return max(self.min, min(self.max, bucket_bounds(index)[1]))
+        return self.max
+
+    def percentiles(self, pcts):
+        return [self.percentile(pct) for pct in pcts]
+
+class SignedHistogram(object):
+    # Negative values go into negative as magnitudes, the others into
+    # positive; percentiles rank the negative values before the others.
+    __slots__ = ('negative', 'positive')
+
+    def __init__(self):
+        self.negative = LogHistogram()
+        self.positive = LogHistogram()
+
+    @property
+    def count(self):
+        return self.negative.count + self.positive.count
+
+    @property
+    def min(self):
+        if self.negative.count:
+            return -self.negative.max
+        return self.positive.min
+
+    @property
+    def max(self):
+        if self.positive.count:
+            return self.positive.max
+        if self.negative.count:
+            return -self.negative.min
+        return None
+
+    def add(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            self.negative.add(-value, count)
+        else:
+            self.positive.add(value, count)
+
+    def merge(self, other):
+        self.negative.merge(other.negative)
+        self.positive.merge(other.positive)
+        return self
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return float(self.positive.total - self.negative.total) / self.count
+
+    def percentile(self, pct):
+        # A negative percentile is the lower bound of its bucket, so it is
+        # rounded away from 0 like a positive one.
+        if not self.count:
+            return 0
+        rank = percentile_rank(pct, self.count)
+        negatives = self.negative.count
+        if rank <= negatives:
+            return -self.negative.ranked(negatives - rank + 1)
+        return self.positive.ranked(rank - negatives)
+
+    def percentiles(self, pcts):
+        return [self.percentile(pct) for pct in pcts]
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+
+# Log readers shared by the analysis scripts.
+#
+# open_gz() returns a line iterator over a gzipped log whose decompression
+# runs alongside the caller's parsing instead of in between: through pigz
+# (or gzip) in a child process when one is on the PATH, otherwise in a
+# reader thread that inflates with zlib, which releases the GIL, and passes
+# blocks through a bounded queue.  PIPELINE = False falls back to
+# gzip.open().
+#
+# open_plain() maps an uncompressed log with mmap instead.  MappedLog finds
+# lines by searching the mapped file for newlines, or for a marker that
+# every interesting line holds, and only copies out the lines it returns.
+# It maps WINDOW bytes at a time and unmaps them once their lines are read,
+# so a reader holds no more of the log in memory than a buffered file does,
+# however many logs are open at once.  line_ranges() cuts a log into newline
+# aligned byte ranges that workers can read independently.  MMAP = False
+# falls back to open().
+#
+# log_time() and format_time() convert between ceph log timestamps and
+# integer microseconds since the epoch.
+
+import calendar
+import gzip
+import mmap
+import os
+import subprocess
+import threading
+import zlib
+from datetime import datetime,timedelta
+from distutils.spawn import find_executable
+from Queue import Queue
+
+EPOCH = datetime(1970, 1, 1)
+
+PIPELINE = True
+
+# External decompressors, in order of preference.
+DECOMPRESSORS = ['pigz', 'gzip']
+
+# Compressed bytes read per block, and blocks the reader may run ahead.
+BLOCK_SIZE = 1 << 20
+QUEUE_DEPTH = 16
+
+MMAP = True
+
+# Bytes MappedLog maps at a time; a multiple of mmap.ALLOCATIONGRANULARITY.
+WINDOW = 4 << 20
+
+# Smallest byte range line_ranges() will cut a log into.
+MIN_RANGE = 32 << 20
+
+def log_time(stamp, _minutes={}):
+    # Convert a 'YYYY-mm-dd HH:MM:SS.ffffff' stamp to integer microseconds
+    # since the epoch.  Everything up to the minute is cached, so a line
+    # costs two int() calls instead of a strptime().
+    minute = _minutes.get(stamp[:16])
+    if minute is None:
+        minute = calendar.timegm((int(stamp[0:4]), int(stamp[5:7]),
+                                  int(stamp[8:10]), int(stamp[11:13]),
+                                  int(stamp[14:16]), 0)) * 1000000
+        _minutes[stamp[:16]] = minute
+    return minute + int(stamp[17:19]) * 1000000 + int(stamp[20:26])
+
+def format_time(usecs, fmt=None):
+    # str() of the datetime, as the original reports printed, unless an
+    # strftime() format is given.
+    if fmt is None:
+        return str(EPOCH + timedelta(microseconds=usecs))
+    return (EPOCH + timedelta(microseconds=usecs)).strftime(fmt)
+
+class ProcessReader(object):
+    def __init__(self, tool, filename):
+        self.tool = tool
+        self.proc = subprocess.Popen([tool, '-dc', filename],
+                                     stdout=subprocess.PIPE,
+                                     bufsize=BLOCK_SIZE)
+
+    def __iter__(self):
+        for line in self.proc.stdout:
+            yield line
+        if self.proc.wait() != 0:
+            raise IOError('%s exited with status %d' % (
+                self.tool, self.proc.returncode))
+
+    def close(self):
+        if self.proc.returncode is None:
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+        self.proc.stdout.close()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ThreadReader(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.queue = Queue(QUEUE_DEPTH)
+        self.stopped = False
+        self.thread = threading.Thread(target=self._inflate)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _inflate(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                while not self.stopped:
+                    data = f.read(BLOCK_SIZE)
+                    if not data:
+                        break
+                    while data:
+                        self.queue.put(inflater.decompress(data))
+                        # A log may be several concatenated gzip members.
+                        data = inflater.unused_data
+                        if data:
+                            self.queue.put(inflater.flush())
+                            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.queue.put(inflater.flush())
+        except Exception as e:
+            self.queue.put(e)
+        self.queue.put(None)
+
+    def __iter__(self):
+        partial = ''
+        while True:
+            block = self.queue.get()
+            if block is None:
+                break
+            if isinstance(block, Exception):
+                raise block
+            end = block.rfind('\n')
+            if end < 0:
+                partial += block
+                continue
+            lines = (partial + block[:end + 1]).splitlines(True)
+            partial = block[end + 1:]
+            for line in lines:
+                yield line
+        if partial:
+            yield partial
+
+    def close(self):
+        self.stopped = True
+        while self.thread.is_alive():
+            # Unblock a reader waiting on a full queue.
+            while not self.queue.empty():
+                self.queue.get()
+            self.thread.join(0.1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_gz(filename):
+    if not PIPELINE:
+        return gzip.open(filename, 'rb')
+    for tool in DECOMPRESSORS:
+        path = find_executable(tool)
+        if path:
+            return ProcessReader(path, filename)
+    return ThreadReader(filename)
+
+class MappedLog(object):
+    # The lines of a plain log starting in [start, end), with their
+    # newlines, or only those containing marker.  start and end must be
+    # line boundaries, as line_ranges() returns.
+    def __init__(self, filename, marker=None, start=0, end=None):
+        self.file = open(filename, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.marker = marker
+        self.start = start
+        self.end = size if end is None else min(end, size)
+
+    def windows(self):
+        # (map, first line, end of the last whole line in it) for successive
+        # windows over [start, end), each unmapped before the next is made.
+        # A window is widened until it holds a whole line.
+        pos = self.start
+        end = self.end
+        size = WINDOW
+        while pos < end:
+            offset = pos - pos % mmap.ALLOCATIONGRANULARITY
+            length = min(size, end - offset)
+            buf = mmap.mmap(self.file.fileno(), length,
+                            access=mmap.ACCESS_READ, offset=offset)
+            try:
+                if offset + length == end:
+                    cut = length
+                else:
+                    cut = buf.rfind('\n', pos - offset) + 1
+                    if not cut:
+                        size *= 2
+                        continue
+                    size = WINDOW
+                yield (buf, pos - offset, cut)
+            finally:
+                buf.close()
+            pos = offset + cut
+
+    def __iter__(self):
+        marker = self.marker
+        for buf, pos, end in self.windows():
+            while pos < end:
+                if marker is None:
+                    line = pos
+                else:
+                    found = buf.find(marker, pos, end)
+                    if found < 0:
+                        break
+                    line = buf.rfind('\n', pos, found) + 1 or pos
+                    pos = found
+                pos = buf.find('\n', pos, end) + 1 or end
+                yield buf[line:pos]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_plain(filename, marker=None):
+    # marker is only a hint: without mmap every line is returned.
+    if not MMAP:
+        return open(filename, 'rb')
+    return MappedLog(filename, marker)
+
+def line_ranges(filename, parts):
+    # Split a log into at most parts [start, end) byte ranges of at least
+    # MIN_RANGE bytes, each ending just after a newline.
+    size = os.path.getsize(filename)
+    parts = max(1, min(parts, size // MIN_RANGE))
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for i in xrange(1, parts):
+            f.seek(size * i // parts)
+            f.readline()
+            at = f.tell()
+            if bounds[-1] < at < size:
+                bounds.append(at)
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
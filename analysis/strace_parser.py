@@ -9,21 +9,43 @@
 #
 # then run this like:
 #
-# strace_parser.py OUT_FILE
-
-import os
-import os.path
-import re
-import sys
-import decimal
-import datetime
-from datetime import datetime
-
-ops = ["writev", "syscall_306", "ftruncate", "openat", "open", "stat", "setxattr", "removexattr", "close", "lseek", "read", "write", "pwrite", "clone", "sync_file_range", "fsync", "getdents", "link", "unlink", "mkdir", "rmdir", "ioctl", "access", "fcntl", "rename"]
-threads = {}
-seconds = {}
-writev_bucket = {}
-first = 0
+# strace_parser.py [--per-second] [--threads] OUT_FILE
+#
+# Each line is split once into pid, time and the call, the call's name is
+# looked up in OP_INDEX, and its latency and (for writev) return value are
+# taken from the end of the line.  Latencies are summed as integer
+# microseconds, and the second is only worked out again when the line's
+# time stamp starts with a different one.
+#
+# A call strace splits with -f, 'name(... <unfinished ...>' then '<... name
+# resumed> ... <latency>', is paired by pid: it started at the time of the
+# unfinished half and lasted the latency of the resumed one.  A pid is in
+# one call at a time, so only one unfinished call per live pid is kept,
+# and a pid's is dropped when it exits.  Every call counts in the second
+# it started in, and its latency is spread over the seconds it overlapped,
+# so a long fsync shows in each second it stalled.  Calls still unfinished
+# at the end of the trace are listed after the tables.
+#
+# Call latencies also go into a log-linear histogram (loghist.py) per
+# syscall per second, in the second the call started, and with --threads
+# per syscall per pid.  Buckets are fixed and only the counts are kept, so
+# the p50/p99/p99.9/max reported per syscall for the whole trace, and with
+# --per-second and --threads per second and per pid, come from a few
+# counters per bucket rather than from every call.
+
+import argparse
+
+import loghist
+
+SECOND = 1000000
+
+# Latency percentiles reported, besides the max.
+PERCENTILES = [50, 99, 99.9]
+
+OPS = ["writev", "syscall_306", "ftruncate", "openat", "open", "stat", "setxattr", "removexattr", "close", "lseek", "read", "write", "pwrite", "clone", "sync_file_range", "fsync", "getdents", "link", "unlink", "mkdir", "rmdir", "ioctl", "access", "fcntl", "rename"]
+OP_INDEX = dict((op, index) for index, op in enumerate(OPS))
+WRITEV = OP_INDEX["writev"]
+SYSCALL_306 = OP_INDEX["syscall_306"]
 
 def fcell(item):
     if isinstance(item, str):
@@ -34,113 +56,241 @@ def fcell(item):
     if isinstance(item, float):
        return ("%.2f" % item).rjust(9)[:9]
 
-last_sec = 0
-filename = sys.argv[1]
-f = open(filename, 'rb')
-for line in f:
-    line = ' '.join(line.split())
-#    print line
-    words = line.split(" ", 2)
-    thread = words[0]
-    unixtime = words[1].split(".")[0]
-    if not (thread.isdigit() or unixtime.isdigit()):
-        print "malformed line: %s" % line
-        continue 
-    
-    if first == 0:
-        first = int(unixtime)
-
-    thread = words[0]
-    if thread not in threads:
-        threads[thread] = {}
-    second = int(unixtime) - first
-    for s in xrange(last_sec, second+1):
-        if s not in seconds:
-            seconds[s] = {}
-            for thread in threads:
-                seconds[s][thread] = {}
-    last_sec = second
-
-    if thread not in seconds[second]:
-        seconds[second][thread] = {}
-
-    op_string = words[2]
-    found = False 
-    for op in ops:
-        add = False
-        if op_string.startswith("<... %s " % op):
-            found = True
-            add = True
-        elif op_string.startswith("%s(" % op): 
-            found = True
-            if "unfinished" not in op_string:
-                add = True
-
-        if add is True:
-            regex = "(\<)(\d+\.\d+)(\>)"
-            match = re.search(regex, op_string)
-            latency = float(match.group(2))
-            if op is "writev":
-                regex = "(= )(\d+)( \<)"
-                match = re.search(regex, op_string)
-                return_code = int(match.group(2))
-                if return_code not in writev_bucket:
-                    writev_bucket[return_code] = 1
+def usecs(text):
+    # '0.000090' -> 90
+    secs, _, frac = text.partition('.')
+    return int(secs) * 1000000 + int((frac + '000000')[:6])
+
+def second_stats(seconds, second):
+    # ([count per op], [latency sum per op], {op index: LogHistogram}).
+    stats = seconds.get(second)
+    if stats is None:
+        stats = ([0] * len(OPS), [0] * len(OPS), {})
+        seconds[second] = stats
+    return stats
+
+def add_latency(hists, key, latency):
+    hist = hists.get(key)
+    if hist is None:
+        hist = loghist.LogHistogram()
+        hists[key] = hist
+    hist.add(latency)
+
+def spread(seconds, index, start, latency):
+    # Count a call in the second it started in and split its latency
+    # between the seconds it overlapped.
+    second = start // SECOND
+    end = start + latency
+    counts, sums, hists = second_stats(seconds, second)
+    counts[index] += 1
+    add_latency(hists, index, latency)
+    while True:
+        upto = min(end, (second + 1) * SECOND)
+        sums[index] += upto - start
+        if upto == end:
+            return second
+        start = upto
+        second += 1
+        sums = second_stats(seconds, second)[1]
+
+def parse(filename, per_thread=False):
+    # Returns ({second: second_stats()}, last second, {writev size: calls},
+    # {pid: (op index, start)} of calls unfinished at the end, and with
+    # per_thread {(pid, op index): LogHistogram}, else None).  Seconds and
+    # times are counted from the first line's second.
+    seconds = {}
+    writev_bucket = {}
+    in_flight = {}
+    threads = {} if per_thread else None
+    first = None
+    last = None
+    # The second of the last line, by its text, its start and its stats.
+    unixtime = None
+    base = cut = 0
+    counts = sums = hists = None
+    op_index = OP_INDEX
+    with open(filename, 'rb') as f:
+        for line in f:
+            fields = line.split(None, 2)
+            if len(fields) < 3:
+                if len(fields) < 2:
+                    print "malformed line: %s" % ' '.join(fields)
+                    continue
+                fields.append('')
+            thread, stamp, call = fields
+            if not stamp.startswith(unixtime or '.'):
+                unixtime = stamp.split(".")[0]
+                if not (thread.isdigit() or unixtime.isdigit()):
+                    print "malformed line: %s" % ' '.join(line.split())
+                    unixtime = None
+                    continue
+                if first is None:
+                    first = int(unixtime)
+                second = int(unixtime) - first
+                if last is None or second > last:
+                    last = second
+                counts, sums, hists = second_stats(seconds, second)
+                base = second * SECOND
+                unixtime += '.'
+                cut = len(unixtime)
+
+            # The call's name: 'name(...' or '<... name resumed> ...'.
+            resumed = call.startswith('<... ')
+            if resumed:
+                end = call.find(' ', 5)
+                index = op_index.get(call[5:end]) if end > 0 else None
+            else:
+                end = call.find('(')
+                index = op_index.get(call[:end]) if end > 0 else None
+            if index is None:
+                if call.startswith('+++ '):
+                    in_flight.pop(thread, None)
+                print "Didn't find op in: %s" % ' '.join(call.split())
+                continue
+            frac = stamp[cut:]
+            if len(frac) == 6:
+                now = base + int(frac)
+            else:
+                now = base + usecs('0.' + frac)
+            if not resumed and "unfinished" in call:
+                in_flight[thread] = (index, now)
+                continue
+
+            end = call.rfind('>')
+            latency = call[call.rfind('<', 0, end) + 1:end]
+            try:
+                if latency[-7:-6] == '.':
+                    usec = int(latency.replace('.', '', 1))
+                else:
+                    usec = usecs(latency)
+            except ValueError:
+                print "No latency in: %s" % ' '.join(call.split())
+                continue
+            if index == SYSCALL_306:
+                print "syscall_306 latency: %s" % float(latency)
+            elif index == WRITEV:
+                words = call[:end].rsplit(None, 3)
+                if len(words) == 4 and words[1] == '=' and \
+                   words[2].isdigit():
+                    size = int(words[2])
+                    writev_bucket[size] = writev_bucket.get(size, 0) + 1
+            start = now
+            if resumed:
+                started = in_flight.pop(thread, None)
+                if started is not None and started[0] == index:
+                    start = started[1]
                 else:
-                    writev_bucket[return_code] += 1
-
-            if op is "syscall_306":
-                print "syscall_306 latency: %s" % latency
-            if op not in seconds[second][thread]:
-                seconds[second][thread][op] = {}
-                seconds[second][thread][op]['count'] = 1
-                seconds[second][thread][op]['latency'] = latency
-                seconds[second][thread][op]['latsum'] = latency
+                    start = now - usec
+            if base <= start and start + usec <= base + SECOND:
+                counts[index] += 1
+                sums[index] += usec
+                hist = hists.get(index)
+                if hist is None:
+                    hist = loghist.LogHistogram()
+                    hists[index] = hist
+                hist.add(usec)
             else:
-                cur_count = seconds[second][thread][op]['count']
-                cur_latency = seconds[second][thread][op]['latency']
-                seconds[second][thread][op]['count'] = cur_count + 1
-                seconds[second][thread][op]['latency'] = (cur_latency * cur_count + latency) / (cur_count + 1)
-                seconds[second][thread][op]['latsum'] += latency
-
-    if found is False:
-        print "Didn't find op in: %s" % op_string
-
-print fcell("second"),
-for op in ops:
-    print fcell(op),
-print ""
-
-for second in seconds:
-    counts = {}
-    latencies = {}
-    latsums = {}
-    for op in ops:
-        counts[op] = 0
-        latencies[op] = 0
-        latsums[op] = 0
-
-    for thread in seconds[second]:
-        th = seconds[second][thread]
-        for op in ops:
-            opdict = th.get(op, {})
-            cur_count = counts[op]
-            cur_latency = latencies[op]
-            counts[op] += opdict.get('count', 0)
-            if counts[op] > 0:
-                latencies[op] = (cur_latency * cur_count + opdict.get('latency', 0)) / counts[op]
-            latsums[op] += opdict.get('latsum', 0)                  
-
-    print fcell(second),
-    for op in ops:
-        if op is "writev":
-            print fcell(counts.get(op, 0)),
-        else: 
-            print fcell(latsums.get(op, 0)),
+                last = max(last, spread(seconds, index, start, usec))
+            if threads is not None:
+                add_latency(threads, (thread, index), usec)
+    return (seconds, last, writev_bucket, in_flight, threads)
+
+def percentile_row(label, hist):
+    return "%s, %d, " % (label, hist.count) + ", ".join(
+        "%.3f" % (value / 1000.0) for value in
+        hist.percentiles(PERCENTILES) + [hist.max])
+
+def percentile_header(label):
+    return "%s, Calls, " % label + ", ".join(
+        ["p%g ms" % p for p in PERCENTILES] + ["Max ms"])
+
+def output(seconds, last, writev_bucket, in_flight, threads,
+           per_second=False):
+    print fcell("second"),
+    for op in OPS:
+        print fcell(op),
+    print ""
+
+    if last is not None:
+        for second in xrange(min([0] + seconds.keys()), last + 1):
+            counts, sums, _ = seconds.get(second, ([0] * len(OPS),
+                                                   [0] * len(OPS), {}))
+            print fcell(second),
+            for index in xrange(len(OPS)):
+                if index == WRITEV:
+                    print fcell(counts[index]),
+                elif counts[index] or sums[index]:
+                    print fcell(sums[index] / float(SECOND)),
+                else:
+                    print fcell(0),
+            print ""
     print ""
-print ""
-print "writev call statistics:"
-print ""
-print "Write Size, Frequency"
-for key in sorted(writev_bucket.keys()):
-    print "%s, %s" % (key, writev_bucket[key])
+    print "writev call statistics:"
+    print ""
+    print "Write Size, Frequency"
+    for key in sorted(writev_bucket.keys()):
+        print "%s, %s" % (key, writev_bucket[key])
+    if in_flight:
+        print ""
+        print "Calls unfinished at end of trace:"
+        print ""
+        print "pid, call, started at second"
+        for pid in sorted(in_flight):
+            index, start = in_flight[pid]
+            print "%s, %s, %.6f" % (pid, OPS[index], start / float(SECOND))
+
+    totals = {}
+    for _, _, hists in seconds.itervalues():
+        for index, hist in hists.iteritems():
+            totals.setdefault(index, loghist.LogHistogram()).merge(hist)
+    print ""
+    print "Syscall latency:"
+    print ""
+    print percentile_header("Syscall")
+    for index in sorted(totals):
+        print percentile_row(OPS[index], totals[index])
+    if per_second:
+        print ""
+        print "Syscall latency per second:"
+        print ""
+        print percentile_header("Second, Syscall")
+        for second in sorted(seconds):
+            hists = seconds[second][2]
+            for index in sorted(hists):
+                print percentile_row("%d, %s" % (second, OPS[index]),
+                                     hists[index])
+    if threads is not None:
+        print ""
+        print "Syscall latency per thread:"
+        print ""
+        print percentile_header("Pid, Syscall")
+        for pid, index in sorted(threads):
+            print percentile_row("%s, %s" % (pid, OPS[index]),
+                                 threads[(pid, index)])
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Report system call latency from strace output.')
+    parser.add_argument(
+        '--per-second',
+        action='store_true',
+        help='Also report latency percentiles per syscall per second.',
+        )
+    parser.add_argument(
+        '--threads',
+        action='store_true',
+        help='Also report latency percentiles per syscall per pid.',
+        )
+    parser.add_argument(
+        'filename',
+        metavar='OUT_FILE',
+        help='strace -f -tttT output.',
+        )
+    return parser.parse_args()
+
+def main():
+    ctx = parse_args()
+    output(*parse(ctx.filename, ctx.threads), per_second=ctx.per_second)
+
+if __name__ == '__main__':
+    main()
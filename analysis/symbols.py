@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+# Symbol tables shared by the analysis scripts.
+#
+# A SymbolTable gives each distinct string a small int code, in order of
+# first appearance, so per-event state can hold the code instead of its own
+# copy of the string.  Worker processes build their own tables and send
+# back the names with the coded data; remap() turns those into codes of the
+# parent's table.
+#
+# EVENTS is the table of op tracker event names that log_analyzer.Request
+# events are coded against.  Event names come from a small vocabulary, so
+# the table stays small however long the logs are; reqids, which do not,
+# are kept as one string per request instead.
+
+class SymbolTable(object):
+    __slots__ = ('names', 'codes')
+
+    def __init__(self, names=None):
+        self.names = []
+        self.codes = {}
+        for name in names or []:
+            self.code(name)
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+    def name(self, code):
+        return self.names[code]
+
+    def find(self, name):
+        # The code of name, or None, without adding it.
+        return self.codes.get(name)
+
+    def remap(self, names):
+        # Codes in this table of another table's names, indexed by the
+        # other table's codes.
+        return [self.code(name) for name in names]
+
+    def __len__(self):
+        return len(self.names)
+
+EVENTS = SymbolTable()
+
+def event_phase(name):
+    # 'waiting for subops from [1,2]', 'sub_op_commit_rec from 2' and friends
+    # carry osd ids; fold them so each phase has one name.
+    return name.split(' from ', 1)[0]
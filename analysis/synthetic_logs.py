@@ -0,0 +1,519 @@
+#!/usr/bin/python
+
+# This program writes a synthetic set of ceph logs for benchmarking the
+# analysis scripts.  For every osd it writes osd.N.log, with op tracker
+# lines (debug optracker = 5), OSD::op_tp and FileStore::op_tp threadpool
+# lines (debug tp = 20), journal write thread lines (debug journal = 20),
+# filestore queue_op/_do_op lines (debug filestore = 5) and other debug
+# output, and osd.N.strace, as written by
+#
+# strace -q -a1 -s0 -f -tttT -oOUT_FILE -e trace=file,desc,process,socket
+#
+# It also writes client.0.log with the objecter lines of every op.
+#
+# Client writes arrive at --rate per second.  Each one is replicated to
+# --replicas osds, where an OSD::op_tp worker takes it, it is journaled and
+# then a FileStore::op_tp worker applies it; each pool has --threads
+# workers.  The logs cover --seconds of log time, or are
+# cut off once the osd logs reach --size megabytes in total.  osd N's
+# clock is ahead by N * --skew microseconds.
+#
+# Usage:
+#
+# synthetic_logs.py [--osds N] [--rate OPS] [--seconds SECONDS] [--size MB]
+#                   [--replicas N] [--threads N] [--noise N] [--skew USECS]
+#                   [--seed N] [--gzip] OUT_DIR
+
+import argparse
+import gzip
+import heapq
+import os
+import os.path
+import random
+import time
+
+import logio
+
+START = '2014-05-01 10:00:00.000000'
+
+# Op tracker events before an OSD::op_tp worker takes the op.
+RECEIVE_EVENTS = ['header_read', 'throttled', 'all_read', 'dispatched']
+
+# Client write sizes, in bytes, and how often each is picked.
+WRITE_SIZES = [4096] * 6 + [16384] * 2 + [65536, 4194304]
+
+# Log time between syncs of the filestore.
+SYNC_INTERVAL = 5000000
+
+NOISE = [
+    (10, 'osd.%(osd)d pg_epoch: %(epoch)d pg[%(pg)s( v %(epoch)d\'%(n)d '
+    '(0\'0,%(epoch)d\'%(n)d] local-les=5 n=%(n)d ec=1 les/c 5/5 4/4/4) '
+    '[%(acting)s] r=0 lpr=4 crt=0\'0 mlcod 0\'0 active+clean] do_op '
+    'osd_op(%(reqid)s rb.0.1.%(oid)08x [write 0~%(size)d] %(pg)s '
+    'ondisk+write e%(epoch)d) v4 may_write'),
+    (20, 'osd.%(osd)d %(epoch)d  dequeue_op 0x%(addr)x prio 63 cost '
+    '%(size)d latency 0.000%(n)03d osd_op(%(reqid)s rb.0.1.%(oid)08x '
+    '[write 0~%(size)d] %(pg)s ondisk+write e%(epoch)d) v4 pg pg[%(pg)s]'),
+    (10, 'journal op_submit_start %(n)d'),
+    (15, 'filestore(/var/lib/ceph/osd/ceph-%(osd)d) write '
+     '%(pg)s_head/rb.0.1.%(oid)08x/head//3 0~%(size)d'),
+    ]
+
+class Stamps(object):
+    # 'YYYY-mm-dd HH:MM:SS.ffffff' for integer microseconds since the
+    # epoch, formatting each second only once.
+    def __init__(self):
+        self.seconds = {}
+
+    def __call__(self, usecs):
+        second, micro = divmod(usecs, 1000000)
+        prefix = self.seconds.get(second)
+        if prefix is None:
+            prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(second))
+            self.seconds[second] = prefix
+        return '%s.%06d' % (prefix, micro)
+
+class LogWriter(object):
+    # Lines are made out of order, so they are kept in a heap and written
+    # once nothing earlier can still be added.
+    def __init__(self, filename, compress=False):
+        if compress:
+            self.file = gzip.open(filename + '.gz', 'wb')
+        else:
+            self.file = open(filename, 'wb')
+        self.heap = []
+        self.lines = 0
+        self.bytes = 0
+
+    def add(self, time, line):
+        heapq.heappush(self.heap, (time, self.lines, line))
+        self.lines += 1
+
+    def flush(self, before=None):
+        heap = self.heap
+        while heap and (before is None or heap[0][0] < before):
+            line = heapq.heappop(heap)[2]
+            self.file.write(line)
+            self.bytes += len(line)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class Worker(object):
+    # A thread that goes to sleep, logging (level, text) of sleep, when it
+    # runs out of work.
+    __slots__ = ('thread', 'pid', 'sleep', 'free', 'waiting')
+
+    def __init__(self, thread, pid, sleep):
+        self.thread = thread
+        self.pid = pid
+        self.sleep = sleep
+        self.free = 0
+        self.waiting = True
+
+class Osd(object):
+    def __init__(self, osd, ctx, rand, stamp):
+        self.id = osd
+        self.rand = rand
+        self.stamp = stamp
+        self.skew = osd * ctx.skew
+        self.noise = ctx.noise
+        self.log = LogWriter(os.path.join(ctx.out_dir, 'osd.%d.log' % osd),
+                             ctx.gzip)
+        self.strace = LogWriter(os.path.join(ctx.out_dir,
+                                             'osd.%d.strace' % osd))
+        self.store = 'filestore(/var/lib/ceph/osd/ceph-%d)' % osd
+        self.base = 0x7f0a1b2c0000 + (osd << 20)
+        self.pid = 20000 + osd * 100
+        self.workers = [Worker(self.base + 0x1000 * (i + 1),
+                               self.pid + 10 + i,
+                               (20, 'FileStore::op_tp worker waiting'))
+                        for i in xrange(ctx.threads)]
+        self.op_workers = [Worker(self.base + 0x10000 * (i + 1),
+                                  self.pid + 50 + i,
+                                  (20, 'OSD::op_tp worker waiting'))
+                           for i in xrange(ctx.threads)]
+        self.journal_writer = Worker(self.base + 0x300, self.pid + 3,
+                                     (10, 'journal write_thread_entry going '
+                                      'to sleep'))
+        self.seq = 0
+        self.op_seq = 0
+        self.dispatches = 0
+        self.queued = []
+        self.next_sync = None
+
+    def line(self, time, thread, level, text):
+        time += self.skew
+        self.log.add(time, '%s %x %2d %s\n' % (self.stamp(time), thread,
+                                               level, text))
+
+    def event(self, time, reqid, event, desc):
+        self.seq += 1
+        self.line(time, self.base, 5, '-- op tracker -- reqid: %s, seq: %d, '
+                  'time: %s, event: %s, request: %s' % (
+                  reqid, self.seq, self.stamp(time + self.skew), event,
+                  desc))
+
+    def syscall(self, pid, time, latency, name, args, ret):
+        # Calls that take a while show up split around other threads'.
+        time += self.skew
+        end = time + latency
+        if latency < 1000:
+            self.strace.add(time, '%d  %d.%06d %s(%s) = %s <%.6f>\n' % (
+                pid, time // 1000000, time % 1000000, name, args, ret,
+                latency / 1000000.0))
+            return
+        self.strace.add(time, '%d  %d.%06d %s(%s <unfinished ...>\n' % (
+            pid, time // 1000000, time % 1000000, name, args))
+        self.strace.add(end, '%d  %d.%06d <... %s resumed> ) = %s '
+                        '<%.6f>\n' % (pid, end // 1000000, end % 1000000,
+                                      name, ret, latency / 1000000.0))
+
+    def noise_lines(self, time, reqid, pg, size, acting):
+        rand = self.rand
+        for _ in xrange(self.noise):
+            n = rand.randint(1, 999)
+            level, text = rand.choice(NOISE)
+            self.line(time + rand.randint(0, 500), self.base + 0x100, level,
+                      text % {
+                          'osd': self.id, 'epoch': 12, 'pg': pg, 'n': n,
+                          'acting': acting, 'reqid': reqid, 'size': size,
+                          'oid': n, 'addr': self.base + n * 0x40})
+
+    def receive(self, time, size):
+        # The messenger reading an op off the wire.
+        self.syscall(self.pid + 1, time - self.rand.randint(10, 40),
+                     self.rand.randint(5, 30), 'read',
+                     '23, ""..., %d' % (size + 200), size + 200)
+
+    def send(self, time, size):
+        self.syscall(self.pid + 2, time, self.rand.randint(5, 30), 'writev',
+                     '23, [{""..., %d}], 1' % size, size)
+
+    def dispatch(self, time):
+        # An OSD::op_tp worker takes an op; returns (worker, item, start).
+        worker = min(self.op_workers, key=lambda w: w.free)
+        start = max(time, worker.free)
+        self.wake(worker, start)
+        self.dispatches += 1
+        item = self.base + 0xc000000 + (self.dispatches % 4096) * 0x380
+        self.line(start, worker.thread, 20, 'OSD::op_tp worker wq OSD::OpWQ '
+                  'start processing 0x%x (1 active)' % item)
+        return (worker, item, start + self.rand.randint(1, 5))
+
+    def dispatched(self, worker, item, time):
+        self.line(time, worker.thread, 20, 'OSD::op_tp worker wq OSD::OpWQ '
+                  'done processing 0x%x (0 active)' % item)
+        worker.free = time + 1
+
+    def journal(self, time, size):
+        # Serial journal writes; returns when the entry is on disk.
+        rand = self.rand
+        writer = self.journal_writer
+        start = max(time + rand.randint(5, 30), writer.free)
+        asleep = writer.waiting or start - writer.free > 100
+        self.wake(writer, start)
+        if asleep:
+            self.line(start - 1, writer.thread, 20,
+                      'journal write_thread_entry woke up')
+        length = size + 4096 - size % 4096 + 4096
+        latency = rand.randint(40, 200) + size // 20000
+        self.syscall(writer.pid, start, latency, 'writev',
+                     '17, [{""..., 4096}, {""..., %d}], 2' % (length - 4096),
+                     length)
+        writer.free = start + latency
+        return writer.free + rand.randint(5, 20)
+
+    def apply(self, time, size, pg):
+        # Queue the write to the op_tp workers; returns when it is applied.
+        rand = self.rand
+        self.op_seq += 1
+        addr = self.base + 0x8000000 + (self.op_seq % 4096) * 0x280
+        osr = self.base + 0x4000000 + int(pg.split('.')[1], 16) * 0x100
+        while self.queued and self.queued[0] <= time:
+            heapq.heappop(self.queued)
+        self.line(time, self.base + 0x200, 5, '%s queue_op 0x%x seq %d '
+                  'osr(%s 0x%x) %d bytes   (queue has %d ops and %d bytes)'
+                  % (self.store, addr, self.op_seq, pg, osr, size,
+                     len(self.queued) + 1, (len(self.queued) + 1) * size))
+        worker = min(self.workers, key=lambda w: w.free)
+        start = max(time + rand.randint(10, 60), worker.free)
+        heapq.heappush(self.queued, start)
+        self.wake(worker, start)
+        now = start
+        self.line(now, worker.thread, 15, 'FileStore::op_tp worker wq '
+                  'FileStore::OpWQ start processing 0x%x (1 active)' % addr)
+        now += rand.randint(1, 5)
+        self.line(now, worker.thread, 5, '%s _do_op 0x%x seq %d '
+                  'osr(%s 0x%x)/0x%x start' % (self.store, addr,
+                                              self.op_seq, pg, osr, osr))
+        fd = rand.randint(30, 90)
+        for name, args, ret, low, high in [
+                ('open', '"current/%s_head/rb.0.1", O_WRONLY|O_CREAT, 0644'
+                 % pg, fd, 10, 40),
+                ('lseek', '%d, 0, SEEK_SET' % fd, 0, 1, 5),
+                ('write', '%d, ""..., %d' % (fd, size), size,
+                 20 + size // 40000, 80 + size // 4000),
+                ('setxattr', '"current/%s_head/rb.0.1", "user.ceph._", '
+                 '""..., 250, 0' % pg, 0, 10, 60),
+                ('close', str(fd), 0, 2, 10)]:
+            now += rand.randint(2, 10)
+            latency = rand.randint(low, high)
+            self.syscall(worker.pid, now, latency, name, args, ret)
+            now += latency
+        now += rand.randint(5, 20)
+        self.line(now, worker.thread, 10, '%s _finish_op 0x%x seq %d '
+                  'osr(%s 0x%x)/0x%x lat %.6f' % (
+                  self.store, addr, self.op_seq, pg, osr, osr,
+                  (now - time) / 1000000.0))
+        now += 1
+        self.line(now, worker.thread, 15, 'FileStore::op_tp worker wq '
+                  'FileStore::OpWQ done processing 0x%x (0 active)' % addr)
+        worker.free = now + 1
+        return now + rand.randint(5, 20)
+
+    def idle(self, worker):
+        level, text = worker.sleep
+        self.line(worker.free + 2, worker.thread, level, text)
+        worker.waiting = True
+
+    def wake(self, worker, start):
+        # worker is given work at start.
+        if not worker.waiting and start - worker.free > 100:
+            self.idle(worker)
+        worker.waiting = False
+
+    def sync(self, time):
+        # The periodic filestore sync.
+        if self.next_sync is None:
+            self.next_sync = time + self.rand.randint(0, SYNC_INTERVAL)
+        if time < self.next_sync:
+            return
+        now = time
+        for fd in xrange(30, 30 + self.rand.randint(2, 6)):
+            latency = self.rand.randint(200, 20000)
+            self.syscall(self.pid + 4, now, latency, 'sync_file_range',
+                         '%d, 0, 0, SYNC_FILE_RANGE_WRITE' % fd, 0)
+            now += latency + self.rand.randint(5, 20)
+        self.syscall(self.pid + 4, now, self.rand.randint(1000, 30000),
+                     'fsync', '17', 0)
+        self.next_sync += SYNC_INTERVAL
+
+    def flush(self, before):
+        # A worker with nothing to do by now went idle when it finished.
+        for worker in self.workers + self.op_workers + [self.journal_writer]:
+            if not worker.waiting and worker.free + 2 < before:
+                self.idle(worker)
+        self.log.flush(before + self.skew)
+        self.strace.flush(before + self.skew)
+
+    def close(self):
+        self.log.close()
+        self.strace.close()
+
+class Cluster(object):
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.rand = random.Random(ctx.seed)
+        self.stamp = Stamps()
+        self.osds = [Osd(i, ctx, self.rand, self.stamp)
+                     for i in xrange(ctx.osds)]
+        self.client = LogWriter(os.path.join(ctx.out_dir, 'client.0.log'))
+
+    def local_write(self, osd, now, size, pg, reqid, desc, commit, applied):
+        # Journal and apply on one osd; returns (commit time, apply time).
+        rand = self.rand
+        osd.event(now, reqid, 'commit_queued_for_journal_write', desc)
+        now += rand.randint(5, 40)
+        osd.event(now, reqid, 'write_thread_in_journal_buffer', desc)
+        now = osd.journal(now, size)
+        osd.event(now, reqid, 'journaled_completion_queued', desc)
+        committed = now + rand.randint(5, 40)
+        osd.event(committed, reqid, commit, desc)
+        done = osd.apply(now, size, pg) + rand.randint(1, 20)
+        osd.event(done, reqid, applied, desc)
+        return (committed, done)
+
+    def take(self, osd, now, reqid, desc):
+        # Receive an op and hand it to an OSD::op_tp worker; returns
+        # (worker, item, time it started).
+        rand = self.rand
+        for event in RECEIVE_EVENTS:
+            now += rand.randint(5, 60)
+            osd.event(now, reqid, event, desc)
+        worker, item, now = osd.dispatch(now + rand.randint(5, 30))
+        osd.event(now, reqid, 'reached_pg', desc)
+        now += rand.randint(5, 60)
+        osd.event(now, reqid, 'started', desc)
+        return (worker, item, now)
+
+    def op(self, n, start):
+        rand = self.rand
+        acting = rand.sample(self.osds, min(self.ctx.replicas,
+                                            len(self.osds)))
+        primary = acting[0]
+        tid = n + 1
+        reqid = 'client.4123.0:%d' % tid
+        pg = '3.%x' % rand.randint(0, 255)
+        size = rand.choice(WRITE_SIZES)
+        desc = 'osd_op(%s rb.0.1.%08x [write 0~%d] %s ondisk+write e12) v4' \
+            % (reqid, n, size, pg)
+        submit = start - rand.randint(50, 300)
+        self.client.add(submit, '%s %x 10 client.4123.objecter _op_submit '
+                        'oid rb.0.1.%08x @3 [write 0~%d] tid %d osd.%d\n' % (
+                        self.stamp(submit), 0x7f1b2c3d4700, n, size, tid,
+                        primary.id))
+        for osd in acting:
+            osd.noise_lines(start, reqid, pg, size,
+                            ','.join(str(o.id) for o in acting))
+            osd.sync(start)
+        primary.receive(start, size)
+        worker, item, now = self.take(primary, start, reqid, desc)
+        now += rand.randint(5, 30)
+        primary.event(now, reqid, 'waiting for subops from [%s]' % ','.join(
+            str(osd.id) for osd in acting[1:]), desc)
+        primary.dispatched(worker, item, now + rand.randint(2, 10))
+        replies = []
+        for osd in acting[1:]:
+            sub = 'osd_sub_op(%s %s rb.0.1.%08x [] v 12\'%d snapset=0=[]:[] ' \
+                'snapc=0=[]) v7' % (reqid, pg, n, tid)
+            primary.send(now, size + 200)
+            at = now + rand.randint(50, 200)
+            osd.receive(at, size)
+            worker, item, at = self.take(osd, at, reqid, sub)
+            osd.dispatched(worker, item, at + rand.randint(2, 10))
+            committed, applied = self.local_write(
+                osd, at + rand.randint(5, 30), size, pg, reqid, sub,
+                'sub_op_commit', 'sub_op_applied')
+            sent = committed + rand.randint(5, 30)
+            osd.event(sent, reqid, 'commit_sent', sub)
+            osd.send(sent, 100)
+            osd.event(max(sent, applied) + rand.randint(5, 30), reqid,
+                      'done', sub)
+            replies.append((sent + rand.randint(50, 200), osd.id))
+        committed, applied = self.local_write(
+            primary, now + rand.randint(5, 30), size, pg, reqid, desc,
+            'op_commit', 'op_applied')
+        for at, osd in replies:
+            primary.event(at, reqid, 'sub_op_commit_rec from %d' % osd, desc)
+        sent = max([committed] + [at for at, _ in replies]) + \
+            rand.randint(5, 30)
+        primary.event(sent, reqid, 'commit_sent', desc)
+        primary.send(sent, 150)
+        primary.event(max(sent, applied) + rand.randint(5, 30), reqid,
+                      'done', desc)
+        reply = sent + rand.randint(50, 300)
+        self.client.add(reply, '%s %x 10 client.4123.objecter '
+                        'handle_osd_op_reply %d ondisk v 12\'%d uv %d in %s '
+                        'attempt 0\n' % (self.stamp(reply), 0x7f1b2c3d4700,
+                                         tid, tid, tid, pg))
+
+    def run(self):
+        ctx = self.ctx
+        start = logio.log_time(START)
+        end = start + int(ctx.seconds * 1000000)
+        limit = None
+        if ctx.size:
+            limit = int(ctx.size * (1 << 20))
+        now = start
+        n = 0
+        while True:
+            now += int(self.rand.expovariate(ctx.rate) * 1000000) + 1
+            if limit is None and now >= end:
+                break
+            self.op(n, now)
+            n += 1
+            # Nothing logged from here on is earlier than the next op's
+            # submit, less the largest client lead.
+            for osd in self.osds:
+                osd.flush(now - 1000)
+            self.client.flush(now - 1000)
+            if limit is not None and \
+               sum(osd.log.bytes for osd in self.osds) >= limit:
+                break
+        for osd in self.osds:
+            osd.close()
+        self.client.close()
+        return n
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write synthetic ceph osd, strace and client logs.')
+    parser.add_argument(
+        '--osds',
+        type=int,
+        default=4,
+        help='Number of osds (default 4).',
+        )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=1000.0,
+        metavar='OPS',
+        help='Client writes per second (default 1000).',
+        )
+    parser.add_argument(
+        '--seconds',
+        type=float,
+        default=10.0,
+        help='Seconds of log time to cover (default 10).',
+        )
+    parser.add_argument(
+        '--size',
+        type=float,
+        metavar='MB',
+        help='Instead of --seconds, stop once the osd logs hold this many '
+             'megabytes in total.',
+        )
+    parser.add_argument(
+        '--replicas',
+        type=int,
+        default=2,
+        help='Osds each write goes to (default 2).',
+        )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=2,
+        help='FileStore op_tp worker threads per osd (default 2).',
+        )
+    parser.add_argument(
+        '--noise',
+        type=int,
+        default=4,
+        help='Other debug lines per op on each osd (default 4).',
+        )
+    parser.add_argument(
+        '--skew',
+        type=int,
+        default=0,
+        metavar='USECS',
+        help='Clock skew of osd N is N times this (default 0).',
+        )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Random seed (default 0).',
+        )
+    parser.add_argument(
+        '--gzip',
+        action='store_true',
+        help='Write the osd logs gzipped, as osd.N.log.gz.',
+        )
+    parser.add_argument(
+        'out_dir',
+        help='Directory to write the logs to.',
+        )
+    return parser.parse_args(argv)
+
+def main():
+    ctx = parse_args()
+    if not os.path.isdir(ctx.out_dir):
+        os.makedirs(ctx.out_dir)
+    ops = Cluster(ctx).run()
+    print "%d ops written to %s" % (ops, ctx.out_dir)
+
+if __name__ == '__main__':
+    main()
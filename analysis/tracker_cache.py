@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+# On-disk cache of parsed op tracker events, one entry per osd log.
+#
+# An entry is the log's events in log order, dictionary encoded: the
+# distinct reqids and event names, plus int columns holding the reqid code,
+# event code and time in microseconds of every event.  Entries are keyed by
+# the log's absolute path and stamped with its size and mtime; an entry
+# whose stamp does not match the log, or that cannot be read back in full,
+# is ignored and rewritten.  Entries are written to a temporary file and
+# renamed into place, so an interrupted run never leaves a partial entry.
+
+import errno
+import hashlib
+import marshal
+import os
+import os.path
+import tempfile
+from array import array
+
+CACHE_VERSION = 1
+
+class EventTable(object):
+    __slots__ = ('reqids', 'reqid_codes', 'events', 'event_codes',
+                 'reqid_col', 'event_col', 'time_col')
+
+    def __init__(self):
+        self.reqids = []
+        self.reqid_codes = {}
+        self.events = []
+        self.event_codes = {}
+        self.reqid_col = array('l')
+        self.event_col = array('l')
+        self.time_col = array('l')
+
+    def append(self, reqid, time, event):
+        code = self.reqid_codes.get(reqid)
+        if code is None:
+            code = len(self.reqids)
+            self.reqid_codes[reqid] = code
+            self.reqids.append(reqid)
+        self.reqid_col.append(code)
+        code = self.event_codes.get(event)
+        if code is None:
+            code = len(self.events)
+            self.event_codes[event] = code
+            self.events.append(event)
+        self.event_col.append(code)
+        self.time_col.append(time)
+
+    def __len__(self):
+        return len(self.time_col)
+
+    def __iter__(self):
+        # (reqid, time, event) in log order.
+        reqids = self.reqids
+        events = self.events
+        for i in xrange(len(self.time_col)):
+            yield (reqids[self.reqid_col[i]], self.time_col[i],
+                   events[self.event_col[i]])
+
+    def dump(self):
+        return (self.reqids, self.events, self.reqid_col.tostring(),
+                self.event_col.tostring(), self.time_col.tostring())
+
+    @classmethod
+    def load(cls, dumped):
+        table = cls()
+        table.reqids, table.events = dumped[0], dumped[1]
+        table.reqid_col.fromstring(dumped[2])
+        table.event_col.fromstring(dumped[3])
+        table.time_col.fromstring(dumped[4])
+        if not len(table.reqid_col) == len(table.event_col) == \
+           len(table.time_col):
+            raise ValueError('columns differ in length')
+        return table
+
+def fingerprint(filename):
+    st = os.stat(filename)
+    return (CACHE_VERSION, os.path.abspath(filename), st.st_size,
+            st.st_mtime)
+
+class ParseCache(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, filename):
+        key = hashlib.sha1(os.path.abspath(filename)).hexdigest()
+        return os.path.join(self.directory, key + '.events')
+
+    def load(self, filename):
+        # The cached EventTable for filename, or None if there is no usable
+        # entry.
+        try:
+            with open(self.path(filename), 'rb') as f:
+                if marshal.load(f) != fingerprint(filename):
+                    return None
+                return EventTable.load(marshal.load(f))
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                IndexError):
+            return None
+
+    def store(self, filename, stamp, table):
+        # stamp is the fingerprint taken before parsing; if the log changed
+        # while it was parsed the entry would be stale, so skip it.
+        if fingerprint(filename) != stamp:
+            return
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(stamp, f)
+                marshal.dump(table.dump(), f)
+            os.rename(tmp, self.path(filename))
+        except:
+            os.unlink(tmp)
+            raise
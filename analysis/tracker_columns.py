@@ -0,0 +1,236 @@
+#!/usr/bin/python
+
+# Columnar export of op tracker events parsed by log_analyzer.py, and a
+# vectorized latency report over such an export.
+#
+# An export holds two tables.  The event table has one row per tracker
+# event: reqid index, osd, event code and time in integer microseconds.
+# The request table has one row per request: reqid index, primary, replica
+# set code and first/last event times.  Codes index into the name lists
+# stored alongside.  Exports are written as .npz (needs numpy) or as
+# Parquet (needs pyarrow), in which case the request table goes to a
+# second FILE.requests.parquet file.
+#
+# Usage:
+#
+# tracker_columns.py EXPORT_FILE
+
+import argparse
+import json
+from array import array
+
+import symbols
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EVENT_COLUMNS = ['ev_reqid', 'ev_osd', 'ev_event', 'ev_time']
+REQUEST_COLUMNS = ['rq_reqid', 'rq_primary', 'rq_replicas', 'rq_first',
+                   'rq_last']
+NAME_LISTS = ['reqids', 'events', 'replica_sets']
+
+# Upper bounds, in milliseconds, of the per-osd duration histogram buckets.
+HISTOGRAM_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000,
+                2000, 5000]
+
+PERCENTILES = [50, 90, 99]
+
+def missing_module(filename):
+    # The module an export to filename needs but cannot import, or None.
+    if numpy is None:
+        return 'numpy'
+    if filename.endswith('.parquet') and pyarrow is None:
+        return 'pyarrow'
+    return None
+
+def require_numpy():
+    if numpy is None:
+        raise RuntimeError('numpy is required for columnar exports')
+
+def requests_filename(filename):
+    return filename[:-len('.parquet')] + '.requests.parquet'
+
+class EventColumns(object):
+    # Accumulates finished log_analyzer.Request objects into flat int64
+    # columns; it is meant to be used as (part of) a Tracker sink.
+    def __init__(self):
+        self.names = dict((name, []) for name in NAME_LISTS)
+        self.codes = dict((name, {}) for name in NAME_LISTS)
+        # Request events are already coded against the shared table.
+        self.names['events'] = symbols.EVENTS.names
+        self.columns = dict((name, array('l'))
+                            for name in EVENT_COLUMNS + REQUEST_COLUMNS)
+
+    def code(self, kind, name):
+        codes = self.codes[kind]
+        code = codes.get(name)
+        if code is None:
+            code = len(self.names[kind])
+            codes[name] = code
+            self.names[kind].append(name)
+        return code
+
+    def add(self, req):
+        columns = self.columns
+        reqid = self.code('reqids', req.reqid)
+        for time, event, osd in req.events:
+            columns['ev_reqid'].append(reqid)
+            columns['ev_osd'].append(osd)
+            columns['ev_event'].append(event)
+            columns['ev_time'].append(time)
+        columns['rq_reqid'].append(reqid)
+        columns['rq_primary'].append(req.primary())
+        columns['rq_replicas'].append(self.code(
+            'replica_sets', ','.join(str(osd) for osd in req.replicas())))
+        columns['rq_first'].append(req.first_event)
+        columns['rq_last'].append(req.last_event)
+
+    def arrays(self):
+        require_numpy()
+        out = {}
+        for name, column in self.columns.iteritems():
+            out[name] = numpy.frombuffer(column, dtype=column.typecode) \
+                .astype(numpy.int64) if len(column) else \
+                numpy.zeros(0, dtype=numpy.int64)
+        for name in NAME_LISTS:
+            out[name] = numpy.array(self.names[name], dtype=str)
+        return out
+
+    def save(self, filename):
+        if filename.endswith('.parquet'):
+            save_parquet(filename, self.arrays())
+        else:
+            numpy.savez_compressed(filename, **self.arrays())
+
+def save_parquet(filename, cols):
+    if pyarrow is None:
+        raise RuntimeError('pyarrow is required for Parquet exports')
+    metadata = {'names': json.dumps(
+        dict((name, list(cols[name])) for name in NAME_LISTS))}
+    for columns, fn in [(EVENT_COLUMNS, filename),
+                        (REQUEST_COLUMNS, requests_filename(filename))]:
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(cols[name]) for name in columns], columns)
+        table = table.replace_schema_metadata(metadata)
+        pyarrow.parquet.write_table(table, fn)
+
+def load(filename):
+    require_numpy()
+    if not filename.endswith('.parquet'):
+        with numpy.load(filename) as npz:
+            return dict((name, npz[name]) for name in npz.files)
+    if pyarrow is None:
+        raise RuntimeError('pyarrow is required for Parquet exports')
+    cols = {}
+    for fn in [filename, requests_filename(filename)]:
+        table = pyarrow.parquet.read_table(fn)
+        for name in table.column_names:
+            chunks = table.column(name).chunks
+            cols[name] = numpy.concatenate([
+                chunk.to_numpy() for chunk in chunks]) if chunks else \
+                numpy.zeros(0, dtype=numpy.int64)
+        names = json.loads(table.schema.metadata['names'])
+    for name in NAME_LISTS:
+        cols[name] = numpy.array(names[name], dtype=str)
+    return cols
+
+def grouped_percentiles(groups, values):
+    # For each distinct group code return (group, count, [percentiles], max)
+    # using one lexsort instead of a pass per group.
+    if not len(values):
+        return []
+    order = numpy.lexsort((values, groups))
+    groups = groups[order]
+    values = values[order]
+    keys, starts, counts = numpy.unique(groups, return_index=True,
+                                        return_counts=True)
+    out = []
+    for key, start, count in zip(keys, starts, counts):
+        chunk = values[start:start + count]
+        out.append((key, count, numpy.percentile(chunk, PERCENTILES),
+                    chunk[-1]))
+    return out
+
+def stage_latencies(cols):
+    # Time from the previous event of the same request on the same osd,
+    # grouped by the (previous event, event) transition.  Event names are
+    # folded as in log_analyzer.py's phase breakdown, so a phase has one row
+    # whichever osds its events name.
+    phases = symbols.SymbolTable()
+    fold = numpy.array([phases.code(symbols.event_phase(name))
+                        for name in cols['events']], dtype=numpy.int64)
+    order = numpy.lexsort((cols['ev_time'], cols['ev_osd'], cols['ev_reqid']))
+    reqid = cols['ev_reqid'][order]
+    osd = cols['ev_osd'][order]
+    event = fold[cols['ev_event'][order]]
+    time = cols['ev_time'][order]
+    same = (reqid[1:] == reqid[:-1]) & (osd[1:] == osd[:-1])
+    transition = event[:-1][same] * len(phases) + event[1:][same]
+    delta = (time[1:] - time[:-1])[same]
+    out = []
+    for key, count, pcts, top in grouped_percentiles(transition, delta):
+        name = '%s -> %s' % (phases.name(key // len(phases)),
+                             phases.name(key % len(phases)))
+        out.append((name, count, pcts, top))
+    return out
+
+def osd_histograms(cols):
+    # Request durations bucketed per primary osd.
+    durations = (cols['rq_last'] - cols['rq_first']) / 1000.0
+    buckets = numpy.searchsorted(HISTOGRAM_MS, durations, side='left')
+    osds, osd_index = numpy.unique(cols['rq_primary'], return_inverse=True)
+    nbuckets = len(HISTOGRAM_MS) + 1
+    counts = numpy.bincount(osd_index * nbuckets + buckets,
+                            minlength=len(osds) * nbuckets)
+    return osds, counts.reshape(len(osds), nbuckets)
+
+def replica_breakdown(cols):
+    durations = cols['rq_last'] - cols['rq_first']
+    return [(cols['replica_sets'][key], count, pcts, top)
+            for key, count, pcts, top in grouped_percentiles(
+                cols['rq_replicas'], durations)]
+
+def print_percentiles(title, rows):
+    width = max([len(row[0]) for row in rows] + [10])
+    print title
+    print "%-*s %10s" % (width, "", "count") + \
+        "".join("%10s" % ("p%d ms" % p) for p in PERCENTILES) + \
+        "%10s" % "max ms"
+    for name, count, pcts, top in rows:
+        print "%-*s %10d" % (width, name, count) + \
+            "".join("%10.3f" % (p / 1000.0) for p in pcts) + \
+            "%10.3f" % (top / 1000.0)
+    print ""
+
+def print_report(cols):
+    print_percentiles("Per-stage latency (same osd)", stage_latencies(cols))
+    print_percentiles("Request latency by replica set",
+                      replica_breakdown(cols))
+    osds, counts = osd_histograms(cols)
+    print "Request duration histogram by primary osd (ms upper bound)"
+    print "%-8s" % "osd" + "".join("%7s" % ("%g" % b) for b in HISTOGRAM_MS) \
+        + "%7s" % "inf"
+    for osd, row in zip(osds, counts):
+        print "%-8s" % osd + "".join("%7d" % c for c in row)
+    print ""
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Vectorized latency report over a tracker export.')
+    parser.add_argument(
+        'export_file',
+        help='.npz or .parquet file written by log_analyzer.py --export.',
+        )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    ctx = parse_args()
+    print_report(load(ctx.export_file))
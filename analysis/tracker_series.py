@@ -0,0 +1,136 @@
+#!/usr/bin/python
+
+# Per-osd time series built from finished op tracker requests: ops completed,
+# average ops in flight and p50/p99 osd residence time per time bucket, for
+# lining up against collectl and similar per-second data.
+#
+# A request counts for every osd it touched, with its span on that osd
+# (first to last event, by that osd's clock).  It is completed in the bucket
+# holding its last event, and the part of its span inside each bucket adds
+# to that bucket's residence time.  Residence time over the bucket width is
+# the average number of ops in flight, as busy time over a second is a
+# threadpool's busy share.  Each (osd, bucket) keeps a counter, the
+# residence time and a LogHistogram of residence times, so the series are
+# built in the same single pass as the rest of the report.  Series are
+# written as CSV, or as .npz with numpy.
+
+import csv
+
+import loghist
+import logio
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PERCENTILES = [50, 99]
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+def missing_module(filename):
+    # The module saving series to filename needs but cannot import, or None.
+    if filename.endswith('.npz') and numpy is None:
+        return 'numpy'
+    return None
+
+class Bucket(object):
+    __slots__ = ('completed', 'residence', 'latency')
+
+    def __init__(self):
+        self.completed = 0
+        self.residence = 0
+        self.latency = loghist.LogHistogram()
+
+class TrackerSeries(object):
+    def __init__(self, width=1.0):
+        # width is the bucket length in seconds.
+        self.width = int(width * 1000000)
+        self.buckets = {}
+
+    def bucket(self, osd, index):
+        bucket = self.buckets.get((osd, index))
+        if bucket is None:
+            bucket = Bucket()
+            self.buckets[(osd, index)] = bucket
+        return bucket
+
+    def add(self, req):
+        spans = {}
+        for time, event, osd in req.events:
+            span = spans.get(osd)
+            if span is None:
+                spans[osd] = [time, time]
+            else:
+                span[1] = time
+        width = self.width
+        for osd, (first, last) in spans.iteritems():
+            index = first // width
+            end = last // width
+            bucket = self.bucket(osd, end)
+            bucket.completed += 1
+            bucket.latency.add(last - first)
+            while index < end:
+                upto = (index + 1) * width
+                self.bucket(osd, index).residence += upto - first
+                first = upto
+                index += 1
+            bucket.residence += last - first
+
+    def rows(self):
+        # (bucket start in usecs, osd, completed, average in flight, p50,
+        # p99) for every osd and every bucket between the first and the last.
+        if not self.buckets:
+            return
+        osds = sorted(set(osd for osd, _ in self.buckets))
+        indexes = [index for _, index in self.buckets]
+        first, last = min(indexes), max(indexes)
+        for index in xrange(first, last + 1):
+            for osd in osds:
+                bucket = self.buckets.get((osd, index))
+                if bucket is None:
+                    yield (index * self.width, osd, 0, 0.0, 0, 0)
+                    continue
+                p50, p99 = bucket.latency.percentiles(PERCENTILES)
+                yield (index * self.width, osd, bucket.completed,
+                       bucket.residence / float(self.width), p50, p99)
+
+    def save(self, filename):
+        if filename.endswith('.npz'):
+            self.save_npz(filename)
+        else:
+            self.save_csv(filename)
+
+    def save_csv(self, filename):
+        with open(filename, 'wb') as f:
+            out = csv.writer(f)
+            out.writerow(['epoch', 'time', 'osd', 'completed',
+                          'avg_in_flight', 'p50_ms', 'p99_ms'])
+            for start, osd, completed, in_flight, p50, p99 in self.rows():
+                out.writerow(['%.6f' % (start / 1000000.0),
+                              logio.format_time(start, TIME_FORMAT), osd,
+                              completed,
+                              '%.3f' % in_flight, '%.3f' % (p50 / 1000.0),
+                              '%.3f' % (p99 / 1000.0)])
+
+    def save_npz(self, filename):
+        # 2-d [osd, bucket] arrays beside the bucket start times and osd ids.
+        if numpy is None:
+            raise RuntimeError('numpy is required for .npz series')
+        rows = list(self.rows())
+        osds = sorted(set(row[1] for row in rows))
+        starts = sorted(set(row[0] for row in rows))
+        shape = (len(osds), len(starts))
+        columns = dict((name, numpy.zeros(shape, dtype=numpy.int64))
+                       for name in ['completed', 'p50', 'p99'])
+        columns['avg_in_flight'] = numpy.zeros(shape, dtype=numpy.float64)
+        osd_index = dict((osd, i) for i, osd in enumerate(osds))
+        for n, (start, osd, completed, in_flight, p50, p99) in \
+                enumerate(rows):
+            at = (osd_index[osd], n // len(osds))
+            columns['completed'][at] = completed
+            columns['avg_in_flight'][at] = in_flight
+            columns['p50'][at] = p50
+            columns['p99'][at] = p99
+        numpy.savez_compressed(filename, start=numpy.array(starts),
+                               osd=numpy.array(osds), **columns)